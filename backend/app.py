@@ -1,15 +1,28 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, WebSocket, Depends, Header
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from ultralytics import YOLO
-from PIL import Image
-import sqlite3
-import io, shutil, os, glob, sys
-from moviepy import VideoFileClip
+import os, sys, asyncio, base64, json, hashlib, time
 from collections import Counter
 
+import config
+import inference
+from inference import PoolBusy, InferenceTimeout, UnreadableImage
+import video
+import live
+import cache
+import columnar
+import metrics
+import auth
+import history
+import jobs
+import uploads
+import tracking
+from cache import ResultCache
+from models import ModelRegistry, ModelVersion, UnknownModel
+from storage import Storage
+
 # ==========================================================
 # Add YOLOv12 folder to PYTHON PATH (for custom model layers)
 # ==========================================================
@@ -31,87 +44,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ==========================================================
-# Database Setup / Utility Functions
-# ==========================================================
-DB_FILE = "users.db"
-
-def ensure_user_table():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def register_user(name, email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
 
+@app.middleware("http")
+async def track_in_flight(request: Request, call_next):
+    metrics.IN_FLIGHT.inc()
     try:
-        cursor.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (name, email, password)
-        )
-        conn.commit()
-        return True, "User registered successfully."
-    except sqlite3.IntegrityError:
-        return False, "Email already exists."
+        return await call_next(request)
     finally:
-        conn.close()
-
-def check_login(email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, email, password FROM users WHERE email=?", (email,))
-    user = cursor.fetchone()
-    conn.close()
-
-    if not user:
-        return False, "User does not exist. Please sign up first."
-
-    _, _, _, db_password = user
-    if db_password == password:
-        return True, "Login successful."
-    else:
-        return False, "Incorrect password."
-
+        metrics.IN_FLIGHT.dec()
 
 # ==========================================================
-# User Model
+# AUTH ROUTES (Signup + Login + Logout) live in auth.py
+# Protected routes take Depends(auth.require_user)
 # ==========================================================
-class User(BaseModel):
-    name: str | None = None
-    email: str
-    password: str
-
-
-# ==========================================================
-# AUTH ROUTES (Signup + Login)
-# ==========================================================
-@app.post("/api/signup")
-async def signup(user: User):
-    success, message = register_user(user.name, user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=201)
-    else:
-        return JSONResponse({"message": message}, status_code=400)
-
-@app.post("/api/login")
-async def login(user: User):
-    success, message = check_login(user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=200)
-    else:
-        return JSONResponse({"message": message}, status_code=401)
+app.include_router(auth.router)
+app.include_router(history.router)
 
 
 # ==========================================================
@@ -119,231 +66,41 @@ async def login(user: User):
 # ==========================================================
 @app.on_event("startup")
 async def load_model():
-    global model
-    weight_path = "weights/best(3).pt"
-
-    if not os.path.exists(weight_path):
-        raise RuntimeError(f"Model file not found: {weight_path}")
-
-    model = YOLO(weight_path)
-    print("🚀 YOLOv12 Model Loaded Successfully!")
-
-
-# ==========================================================
-# Static Files Configuration
-# ==========================================================
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-os.makedirs("static/uploads", exist_ok=True)
-os.makedirs("static/detections", exist_ok=True)
-
-
-# ==========================================================
-# Utility: Convert YOLO .avi to .mp4
-# ==========================================================
-def convert_avi_to_mp4(input_path: str) -> str:
-    if not input_path.lower().endswith(".avi"):
-        return input_path
-
-    output_path = input_path.replace(".avi", ".mp4")
-    with VideoFileClip(input_path) as clip:
-        clip.write_videofile(
-            output_path,
-            codec="libx264",
-            audio_codec="aac",
-            fps=clip.fps or 20
-        )
-    os.remove(input_path)
-    return output_path
-
-
-# ==========================================================
-# PPE Detection Route
-# ==========================================================
-@app.post("/api/predict/")
-async def predict(file: UploadFile = File(...)):
-    try:
-        upload_path = f"static/uploads/{file.filename}"
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        is_video = file.content_type.startswith("video/")
-
-        # Run YOLO
-        results = model.predict(
-            source=upload_path,
-            save=True,
-            conf=0.60,
-            project="static",
-            name="detections",
-            exist_ok=True
-        )
-
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class": model.names[int(box.cls)],
-                    "confidence": float(box.conf)
-                })
-
-        base_name = os.path.splitext(file.filename)[0]
-        output_dir = "static/detections"
-        detected_files = glob.glob(f"{output_dir}/{base_name}*")
-        annotated_path = detected_files[0].replace("\\", "/") if detected_files else None
-
-        if annotated_path and annotated_path.endswith(".avi"):
-            annotated_path = convert_avi_to_mp4(annotated_path)
-
-        summary = Counter([d["class"] for d in detections])
-
-        return JSONResponse({
-            "detections": detections,
-            "summary": summary,
-            "original_image": f"/static/uploads/{file.filename}",
-            "annotated_image": "/" + annotated_path if annotated_path else None,
-            "is_video": is_video
-        })
-
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
-
-
-# ==========================================================
-# ROOT ROUTE
-# ==========================================================
-@app.get("/")
-def root():
-    return {"message": "PPE detection API running!"}
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from ultralytics import YOLO
-from PIL import Image
-import sqlite3
-import io, shutil, os, glob, sys
-from moviepy import VideoFileClip
-from collections import Counter
-
-# ==========================================================
-# Add YOLOv12 folder to PYTHON PATH (for custom model layers)
-# ==========================================================
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'yolov12'))
-
-# ==========================================================
-# FastAPI Application
-# ==========================================================
-app = FastAPI(title="PPE Detection + Auth API", version="2.0")
-
-# ==========================================================
-# CORS Policy
-# ==========================================================
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],          # allow all domains
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    global registry, result_cache, job_queue, upload_store, storage, ready
 
-# ==========================================================
-# Database Setup / Utility Functions
-# ==========================================================
-DB_FILE = "users.db"
-
-def ensure_user_table():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    # Open the auth DB pool and apply the schema once, not per request
+    auth.startup()
+    history.startup()
+    storage = Storage()
+    metrics.STORAGE_BYTES.set_function(lambda: storage.total_bytes)
 
-def register_user(name, email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
+    result_cache = ResultCache()
 
-    try:
-        cursor.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (name, email, password)
-        )
-        conn.commit()
-        return True, "User registered successfully."
-    except sqlite3.IntegrityError:
-        return False, "Email already exists."
-    finally:
-        conn.close()
-
-def check_login(email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, email, password FROM users WHERE email=?", (email,))
-    user = cursor.fetchone()
-    conn.close()
-
-    if not user:
-        return False, "User does not exist. Please sign up first."
-
-    _, _, _, db_password = user
-    if db_password == password:
-        return True, "Login successful."
-    else:
-        return False, "Incorrect password."
+    # Every configured weight file gets its own warmed-up worker pool
+    registry = ModelRegistry()
+    await registry.start()
+    metrics.QUEUE_DEPTH.set_function(lambda: registry.pending)
 
+    job_queue = jobs.JobQueue(run_job)
+    upload_store = uploads.UploadStore()
+    await job_queue.start()
+    # Files queued jobs still need are never evicted
+    storage.protected = job_queue.active_paths
+    storage.start()
+    ready = True
+    print(f"🚀 YOLOv12 Model Loaded Successfully! "
+          f"(models: {', '.join(registry.specs)}; default: {registry.default})")
 
-# ==========================================================
-# User Model
-# ==========================================================
-class User(BaseModel):
-    name: str | None = None
-    email: str
-    password: str
 
-
-# ==========================================================
-# AUTH ROUTES (Signup + Login)
-# ==========================================================
-@app.post("/api/signup")
-async def signup(user: User):
-    success, message = register_user(user.name, user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=201)
-    else:
-        return JSONResponse({"message": message}, status_code=400)
-
-@app.post("/api/login")
-async def login(user: User):
-    success, message = check_login(user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=200)
-    else:
-        return JSONResponse({"message": message}, status_code=401)
-
-
-# ==========================================================
-# Load YOLO Model on Startup ONLY ONCE
-# ==========================================================
-@app.on_event("startup")
-async def load_model():
-    global model
-    weight_path = "weights/best(3).pt"
-
-    if not os.path.exists(weight_path):
-        raise RuntimeError(f"Model file not found: {weight_path}")
-
-    model = YOLO(weight_path)
-    print("🚀 YOLOv12 Model Loaded Successfully!")
+@app.on_event("shutdown")
+async def unload_model():
+    for upload_id in list(preview_tasks):
+        cancel_preview(upload_id)
+    await job_queue.stop()
+    await storage.stop()
+    await registry.stop()
+    await history.shutdown()
+    auth.shutdown()
 
 
 # ==========================================================
@@ -356,725 +113,650 @@ os.makedirs("static/detections", exist_ok=True)
 
 
 # ==========================================================
-# Utility: Convert YOLO .avi to .mp4
+# Upload / Artifact Helpers
 # ==========================================================
-def convert_avi_to_mp4(input_path: str) -> str:
-    if not input_path.lower().endswith(".avi"):
-        return input_path
-
-    output_path = input_path.replace(".avi", ".mp4")
-    with VideoFileClip(input_path) as clip:
-        clip.write_videofile(
-            output_path,
-            codec="libx264",
-            audio_codec="aac",
-            fps=clip.fps or 20
-        )
-    os.remove(input_path)
-    return output_path
-
+def save_upload(file: UploadFile):
+    """Store the upload under its content address; returns (path, SHA-256).
 
-# ==========================================================
-# PPE Detection Route
-# ==========================================================
-@app.post("/api/predict/")
-async def predict(file: UploadFile = File(...)):
-    try:
-        upload_path = f"static/uploads/{file.filename}"
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    It is hashed on the way to a scratch file, then moved into place.
+    """
+    scratch = storage.temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    with metrics.UPLOAD_WRITE_SECONDS.time():
+        with open(scratch, "wb") as buffer:
+            for block in iter(lambda: file.file.read(1024 * 1024), b""):
+                digest.update(block)
+                buffer.write(block)
+                size += len(block)
+    metrics.UPLOAD_BYTES.observe(size, kind=upload_kind(file))
+    digest = digest.hexdigest()
+    return storage.adopt(scratch, "upload", digest, upload_ext(file.filename)), digest
 
-        is_video = file.content_type.startswith("video/")
 
-        # Run YOLO
-        results = model.predict(
-            source=upload_path,
-            save=True,
-            conf=0.60,
-            project="static",
-            name="detections",
-            exist_ok=True
-        )
+def upload_kind(file: UploadFile):
+    return "video" if (file.content_type or "").startswith("video/") else "image"
 
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class": model.names[int(box.cls)],
-                    "confidence": float(box.conf)
-                })
 
-        base_name = os.path.splitext(file.filename)[0]
-        output_dir = "static/detections"
-        detected_files = glob.glob(f"{output_dir}/{base_name}*")
-        annotated_path = detected_files[0].replace("\\", "/") if detected_files else None
+def upload_ext(filename: str | None):
+    ext = os.path.splitext(filename or "")[1]
+    return ext if 1 < len(ext) <= 6 and ext[1:].isalnum() else ""
 
-        if annotated_path and annotated_path.endswith(".avi"):
-            annotated_path = convert_avi_to_mp4(annotated_path)
 
-        summary = Counter([d["class"] for d in detections])
+def store_bytes(data: bytes, kind: str, digest: str, ext: str):
+    scratch = storage.temp_path()
+    with open(scratch, "wb") as f:
+        f.write(data)
+    return storage.adopt(scratch, kind, digest, ext)
 
-        return JSONResponse({
-            "detections": detections,
-            "summary": summary,
-            "original_image": f"/static/uploads/{file.filename}",
-            "annotated_image": "/" + annotated_path if annotated_path else None,
-            "is_video": is_video
-        })
 
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+def touch_artifacts(payload: dict):
+    # Cache hits keep their files from being evicted as unused
+    storage.touch(*(
+        url[1:] for url in (payload.get("original_image"), payload.get("annotated_image"))
+        if url and url.startswith("/static/")
+    ))
 
 
-# ==========================================================
-# ROOT ROUTE
-# ==========================================================
-@app.get("/")
-def root():
-    return {"message": "PPE detection API running!"}
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from ultralytics import YOLO
-from PIL import Image
-import sqlite3
-import io, shutil, os, glob, sys
-from moviepy import VideoFileClip
-from collections import Counter
+def cache_key(model: ModelVersion, digest: str, variant: str):
+    return cache.make_key(digest, model.fingerprint, config.CONFIDENCE, variant)
 
-# ==========================================================
-# Add YOLOv12 folder to PYTHON PATH (for custom model layers)
-# ==========================================================
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'yolov12'))
 
-# ==========================================================
-# FastAPI Application
-# ==========================================================
-app = FastAPI(title="PPE Detection + Auth API", version="2.0")
+def artifact_ext(key: str, ext: str):
+    # Annotated files carry the cache key, so results computed with other
+    # weights, sampling or tracker settings never overwrite each other
+    return f".{key[:16]}{ext}"
 
-# ==========================================================
-# CORS Policy
-# ==========================================================
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],          # allow all domains
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# ==========================================================
-# Database Setup / Utility Functions
-# ==========================================================
-DB_FILE = "users.db"
-
-def ensure_user_table():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
+def cached_response(payload: dict, hit: bool, output: str = "json", fmt: str | None = None):
+    # Stream the annotated JPEG itself, detections ride along in a header
+    if output == "image":
+        annotated = base64.b64decode(payload["annotated_image"].split(",", 1)[1])
+        return Response(
+            annotated,
+            media_type="image/jpeg",
+            headers={"X-Detections-Summary": json.dumps(payload["summary"]),
+                     "X-Cache": "HIT" if hit else "MISS"}
         )
-    """)
-    conn.commit()
-    conn.close()
+    if fmt is not None:
+        body, media_type = columnar.encode(fmt, payload)
+        return Response(body, media_type=media_type, headers={"X-Cache": "HIT" if hit else "MISS"})
+    return JSONResponse(payload, headers={"X-Cache": "HIT" if hit else "MISS"})
 
-def register_user(name, email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
 
-    try:
-        cursor.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (name, email, password)
-        )
-        conn.commit()
-        return True, "User registered successfully."
-    except sqlite3.IntegrityError:
-        return False, "Email already exists."
-    finally:
-        conn.close()
-
-def check_login(email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, email, password FROM users WHERE email=?", (email,))
-    user = cursor.fetchone()
-    conn.close()
-
-    if not user:
-        return False, "User does not exist. Please sign up first."
-
-    _, _, _, db_password = user
-    if db_password == password:
-        return True, "Login successful."
+def record_history(payload: dict, filename: str, user: dict | None):
+    # Queued for the background writer; costs nothing on the request path
+    source = "video" if payload["is_video"] else "image"
+    if "detections" in payload:
+        history.record(source, filename, payload["detections"], user)
     else:
-        return False, "Incorrect password."
+        # Columnar payloads carry no per-box rows; the summary's class counts
+        # are stored as they are, one row per class
+        history.record_summary(source, filename, payload["summary"], user)
+
+
+async def predict_in_memory(model: ModelVersion, file: UploadFile, save: bool, output: str,
+                            user: dict | None = None, fmt: str | None = None):
+    data = await file.read()
+    metrics.UPLOAD_BYTES.observe(len(data), kind="image")
+
+    # The inline (data: URL) payload serves both output=json and output=image
+    digest = hashlib.sha256(data).hexdigest()
+    columns = fmt is not None and output != "image"
+    variant = "memory-saved" if save and output != "image" else "memory"
+    key = cache_key(model, digest, variant + ("-columns" if columns else ""))
+    payload = await asyncio.to_thread(result_cache.get, key)
+    if payload is not None:
+        touch_artifacts(payload)
+        record_history(payload, file.filename, user)
+        return cached_response(payload, True, output, fmt if columns else None)
+
+    # Columnar requests skip the micro-batcher, which only carries the row format
+    if model.memory_batcher is not None and not columns:
+        result = await model.memory_batcher.submit(data)
+    else:
+        result = (await model.pool.run(inference.predict_images, [data], config.CONFIDENCE, columns))[0]
 
+    if "error" in result:
+        return JSONResponse({"error": result["error"]}, status_code=400)
 
-# ==========================================================
-# User Model
-# ==========================================================
-class User(BaseModel):
-    name: str | None = None
-    email: str
-    password: str
+    detections = result["detections"]
+    annotated = result["annotated"]
+    summary = video.class_counts(detections)
 
-
-# ==========================================================
-# AUTH ROUTES (Signup + Login)
-# ==========================================================
-@app.post("/api/signup")
-async def signup(user: User):
-    success, message = register_user(user.name, user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=201)
+    original_url = None
+    if save and output != "image":
+        original_path = await asyncio.to_thread(store_bytes, data, "upload", digest, upload_ext(file.filename))
+        annotated_path = await asyncio.to_thread(store_bytes, annotated, "annotated", digest, artifact_ext(key, ".jpg"))
+        original_url = "/" + original_path
+        annotated_url = "/" + annotated_path
     else:
-        return JSONResponse({"message": message}, status_code=400)
-
-@app.post("/api/login")
-async def login(user: User):
-    success, message = check_login(user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=200)
+        annotated_url = "data:image/jpeg;base64," + base64.b64encode(annotated).decode("ascii")
+
+    payload = {
+        "detections": detections,
+        "summary": summary,
+        "original_image": original_url,
+        "annotated_image": annotated_url,
+        "is_video": False,
+        "model": model.name
+    }
+    if columns:
+        payload["columns"] = columnar.pack(payload.pop("detections"))
+    # Serialising the inline image and the disk write stay off the event loop
+    await asyncio.to_thread(result_cache.put, key, payload)
+    record_history(payload, file.filename, user)
+    return cached_response(payload, False, output, fmt if columns else None)
+
+
+async def predict_video(model: ModelVersion, upload_path: str, digest: str, key: str, progress=None,
+                        columns: bool = False):
+    # Same chunked pipeline as /api/predict/stream; the annotated MP4
+    # is encoded once while inference runs, no AVI round-trip
+    # With VIDEO_TRACKING the result lists each tracked object once, with
+    # its timeline, instead of one row per box per frame. With ``columns``
+    # every box comes back in one NumPy block (plus the tracks).
+    output_path = storage.temp_path(".mp4")
+    info = await asyncio.to_thread(video.video_info, upload_path)
+    tracker = tracking.Tracker(info["fps"]) if config.VIDEO_TRACKING else None
+    detections, annotated_path = [], None
+    blocks, frames = [], []
+    async for event in video.stream_detections(model.pool, upload_path, output_path, config.CONFIDENCE,
+                                               columns=columns):
+        if event.get("done"):
+            if event["annotated_path"]:
+                annotated_path = await asyncio.to_thread(
+                    storage.adopt, event["annotated_path"], "annotated", digest, artifact_ext(key, ".mp4")
+                )
+        else:
+            if tracker is not None:
+                tracker.update(event["frame"], event["detections"])
+            if columns:
+                blocks.append(event["detections"])
+                frames.append(event["frame"])
+            elif tracker is None:
+                detections.extend(
+                    {"class": d["class"], "confidence": d["confidence"]} for d in event["detections"]
+                )
+            if progress:
+                progress(event["frame"] + 1, max(info["frames"], event["frame"] + 1))
+
+    tracks = tracker.tracks() if tracker is not None else None
+    if columns:
+        return columnar.concat(blocks, frames), annotated_path, tracks
+    if tracker is None:
+        return detections, annotated_path, None
+    detections = [
+        {"class": t["class"], "confidence": t["confidence"], "track_id": t["track_id"]} for t in tracks
+    ]
+    return detections, annotated_path, tracks
+
+
+async def analyse_upload(model: ModelVersion, upload_path: str, filename: str, digest: str, is_video: bool,
+                         user: dict | None = None, progress=None, columns: bool = False):
+    """Detections payload for an upload already on disk; returns (payload, cache_hit).
+
+    With ``columns`` the boxes are kept as packed NumPy columns (see
+    columnar.py) under ``columns`` instead of a ``detections`` list.
+    """
+    # Same bytes, same weights, same threshold (and for videos the same
+    # sampling and tracker settings): reuse the last answer
+    variant = "-".join(filter(None, ["disk", video.signature(), tracking.signature()])) if is_video else "disk"
+    key = cache_key(model, digest, variant + ("-columns" if columns else ""))
+    payload = await asyncio.to_thread(result_cache.get, key)
+    if payload is not None:
+        touch_artifacts(payload)
+        record_history(payload, filename, user)
+        return payload, True
+
+    # Run YOLO on the worker pool so the event loop stays free.
+    # Concurrent images are micro-batched into one forward pass.
+    tracks = None
+    if is_video:
+        detections, annotated_path, tracks = await predict_video(model, upload_path, digest, key, progress, columns)
     else:
-        return JSONResponse({"message": message}, status_code=401)
-
-
-# ==========================================================
-# Load YOLO Model on Startup ONLY ONCE
-# ==========================================================
-@app.on_event("startup")
-async def load_model():
-    global model
-    weight_path = "weights/best(3).pt"
-
-    if not os.path.exists(weight_path):
-        raise RuntimeError(f"Model file not found: {weight_path}")
-
-    model = YOLO(weight_path)
-    print("🚀 YOLOv12 Model Loaded Successfully!")
-
-
-# ==========================================================
-# Static Files Configuration
-# ==========================================================
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-os.makedirs("static/uploads", exist_ok=True)
-os.makedirs("static/detections", exist_ok=True)
-
-
-# ==========================================================
-# Utility: Convert YOLO .avi to .mp4
-# ==========================================================
-def convert_avi_to_mp4(input_path: str) -> str:
-    if not input_path.lower().endswith(".avi"):
-        return input_path
-
-    output_path = input_path.replace(".avi", ".mp4")
-    with VideoFileClip(input_path) as clip:
-        clip.write_videofile(
-            output_path,
-            codec="libx264",
-            audio_codec="aac",
-            fps=clip.fps or 20
-        )
-    os.remove(input_path)
-    return output_path
+        # The worker writes the annotated image straight to its content address
+        annotated_path = storage.path_for("annotated", digest, artifact_ext(key, ".jpg"))
+        if model.batcher is not None and not columns:
+            detections = await model.batcher.submit((upload_path, annotated_path))
+        else:
+            detections = await model.pool.run(
+                inference.predict_file, upload_path, config.CONFIDENCE, annotated_path, columns
+            )
+        await asyncio.to_thread(storage.add, annotated_path, "annotated", digest)
+    if progress and not is_video:
+        progress(1, 1)
+
+    if tracks is not None:
+        summary = Counter(t["class"] for t in tracks)
+    else:
+        summary = video.class_counts(detections)
+
+    payload = {
+        "detections": detections,
+        "summary": summary,
+        "original_image": "/" + upload_path,
+        "annotated_image": "/" + annotated_path if annotated_path else None,
+        "is_video": is_video,
+        "model": model.name
+    }
+    if columns:
+        payload["columns"] = columnar.pack(payload.pop("detections"))
+    if tracks is not None:
+        payload["tracks"] = tracks
+        payload["violations"] = tracking.count_violations(tracks)
+    await asyncio.to_thread(result_cache.put, key, payload)
+    record_history(payload, filename, user)
+    return payload, False
 
 
 # ==========================================================
 # PPE Detection Route
 # ==========================================================
 @app.post("/api/predict/")
-async def predict(file: UploadFile = File(...)):
+async def predict(
+    file: UploadFile = File(...),
+    in_memory: bool | None = Query(None),
+    save: bool | None = Query(None),
+    output: str = Query("json"),
+    model: str | None = Query(None),
+    accept: str | None = Header(None),
+    user: dict | None = Depends(auth.require_user),
+):
+    started = time.perf_counter()
     try:
-        upload_path = f"static/uploads/{file.filename}"
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
         is_video = file.content_type.startswith("video/")
-
-        # Run YOLO
-        results = model.predict(
-            source=upload_path,
-            save=True,
-            conf=0.60,
-            project="static",
-            name="detections",
-            exist_ok=True
-        )
-
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class": model.names[int(box.cls)],
-                    "confidence": float(box.conf)
-                })
-
-        base_name = os.path.splitext(file.filename)[0]
-        output_dir = "static/detections"
-        detected_files = glob.glob(f"{output_dir}/{base_name}*")
-        annotated_path = detected_files[0].replace("\\", "/") if detected_files else None
-
-        if annotated_path and annotated_path.endswith(".avi"):
-            annotated_path = convert_avi_to_mp4(annotated_path)
-
-        summary = Counter([d["class"] for d in detections])
-
-        return JSONResponse({
-            "detections": detections,
-            "summary": summary,
-            "original_image": f"/static/uploads/{file.filename}",
-            "annotated_image": "/" + annotated_path if annotated_path else None,
-            "is_video": is_video
-        })
-
+        # Accept: application/vnd.ppe.columnar+json | application/msgpack |
+        # application/vnd.apache.arrow.stream selects the compact format
+        fmt = columnar.negotiate(accept) if output == "json" else None
+
+        # The request finishes on the version it started with, even if
+        # a new one is swapped in meanwhile
+        with registry.lease(model) as version:
+            # In-memory mode: decode the upload bytes directly, no disk round-trip
+            if in_memory is None:
+                in_memory = config.IMAGE_MODE == "memory"
+            if in_memory and not is_video:
+                save = bool(config.SAVE_ARTIFACTS) if save is None else save
+                return await predict_in_memory(version, file, save, output, user, fmt)
+
+            upload_path, digest = await asyncio.to_thread(save_upload, file)
+
+            payload, hit = await analyse_upload(version, upload_path, file.filename, digest, is_video, user,
+                                                columns=fmt is not None)
+            return cached_response(payload, hit, fmt=fmt)
+
+    except (UnknownModel, UnreadableImage) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except columnar.NotAcceptable as e:
+        return JSONResponse({"error": str(e)}, status_code=406)
+    except PoolBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "1"})
+    except InferenceTimeout as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route="predict")
 
 
 # ==========================================================
-# ROOT ROUTE
-# ==========================================================
-@app.get("/")
-def root():
-    return {"message": "PPE detection API running!"}
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from ultralytics import YOLO
-from PIL import Image
-import sqlite3
-import io, shutil, os, glob, sys
-from moviepy import VideoFileClip
-from collections import Counter
-
-# ==========================================================
-# Add YOLOv12 folder to PYTHON PATH (for custom model layers)
-# ==========================================================
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'yolov12'))
-
-# ==========================================================
-# FastAPI Application
-# ==========================================================
-app = FastAPI(title="PPE Detection + Auth API", version="2.0")
-
-# ==========================================================
-# CORS Policy
+# Background Jobs (submit now, poll GET /api/jobs/{id})
 # ==========================================================
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],          # allow all domains
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# ==========================================================
-# Database Setup / Utility Functions
-# ==========================================================
-DB_FILE = "users.db"
-
-def ensure_user_table():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
+async def run_job(job: dict, progress):
+    user = {"sub": job["user_id"]} if job["user_id"] is not None else None
+    with registry.lease(job["model"]) as model:
+        payload, _ = await analyse_upload(
+            model, job["upload_path"], job["filename"], job["digest"], job["kind"] == "video", user, progress
         )
-    """)
-    conn.commit()
-    conn.close()
+    return payload
 
-def register_user(name, email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
 
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    model: str | None = Query(None),
+    user: dict | None = Depends(auth.require_user),
+):
     try:
-        cursor.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (name, email, password)
+        registry.get(model)
+    except UnknownModel as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    upload_path, digest = await asyncio.to_thread(save_upload, file)
+    try:
+        job_id = await job_queue.submit(
+            upload_kind(file), upload_path, file.filename, digest, user["sub"] if user else None, model
         )
-        conn.commit()
-        return True, "User registered successfully."
-    except sqlite3.IntegrityError:
-        return False, "Email already exists."
-    finally:
-        conn.close()
-
-def check_login(email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, email, password FROM users WHERE email=?", (email,))
-    user = cursor.fetchone()
-    conn.close()
-
-    if not user:
-        return False, "User does not exist. Please sign up first."
-
-    _, _, _, db_password = user
-    if db_password == password:
-        return True, "Login successful."
-    else:
-        return False, "Incorrect password."
+    except jobs.QueueFull as e:
+        return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
+    return JSONResponse({"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"},
+                        status_code=202)
 
 
-# ==========================================================
-# User Model
-# ==========================================================
-class User(BaseModel):
-    name: str | None = None
-    email: str
-    password: str
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str, user: dict | None = Depends(auth.require_user)):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None or (user and job["user_id"] not in (None, user["sub"])):
+        return JSONResponse({"error": "Job not found."}, status_code=404)
+    for field in ("upload_path", "digest", "user_id", "priority"):
+        job.pop(field)
+    return job
 
 
 # ==========================================================
-# AUTH ROUTES (Signup + Login)
+# Resumable Chunked Uploads
+#   POST   /api/uploads                 {filename, size, content_type, sha256}
+#   PUT    /api/uploads/{id}?offset=N   raw chunk, X-Chunk-SHA256 header
+#   GET    /api/uploads/{id}            offset to resume from + preview
+#   POST   /api/uploads/{id}/finalize   queues the analysis job
+#   DELETE /api/uploads/{id}
 # ==========================================================
-@app.post("/api/signup")
-async def signup(user: User):
-    success, message = register_user(user.name, user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=201)
-    else:
-        return JSONResponse({"message": message}, status_code=400)
-
-@app.post("/api/login")
-async def login(user: User):
-    success, message = check_login(user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=200)
-    else:
-        return JSONResponse({"message": message}, status_code=401)
+preview_tasks = {}     # upload id -> early analysis of a partial video
 
 
-# ==========================================================
-# Load YOLO Model on Startup ONLY ONCE
-# ==========================================================
-@app.on_event("startup")
-async def load_model():
-    global model
-    weight_path = "weights/best(3).pt"
+class UploadInit(BaseModel):
+    filename: str
+    size: int
+    content_type: str | None = None
+    sha256: str | None = None
 
-    if not os.path.exists(weight_path):
-        raise RuntimeError(f"Model file not found: {weight_path}")
 
-    model = YOLO(weight_path)
-    print("🚀 YOLOv12 Model Loaded Successfully!")
+class UploadFinalize(BaseModel):
+    sha256: str | None = None
+    model: str | None = None
 
 
-# ==========================================================
-# Static Files Configuration
-# ==========================================================
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def upload_error(e: uploads.UploadError):
+    return JSONResponse({"error": str(e), "offset": e.offset}, status_code=e.status_code)
 
-os.makedirs("static/uploads", exist_ok=True)
-os.makedirs("static/detections", exist_ok=True)
 
+def owned_upload(upload_id: str, user: dict | None):
+    session = upload_store.get(upload_id)
+    if session is None or (user and session.user_id not in (None, user["sub"])):
+        raise HTTPException(status_code=404, detail="Upload not found.")
+    return session
 
-# ==========================================================
-# Utility: Convert YOLO .avi to .mp4
-# ==========================================================
-def convert_avi_to_mp4(input_path: str) -> str:
-    if not input_path.lower().endswith(".avi"):
-        return input_path
-
-    output_path = input_path.replace(".avi", ".mp4")
-    with VideoFileClip(input_path) as clip:
-        clip.write_videofile(
-            output_path,
-            codec="libx264",
-            audio_codec="aac",
-            fps=clip.fps or 20
-        )
-    os.remove(input_path)
-    return output_path
 
+async def preview_upload(session: uploads.UploadSession):
+    """Sampled analysis of the part of a video received so far.
 
-# ==========================================================
-# PPE Detection Route
-# ==========================================================
-@app.post("/api/predict/")
-async def predict(file: UploadFile = File(...)):
+    Decoding stops at the first frame whose bytes have not arrived yet;
+    containers that keep their index at the end cannot be opened early.
+    """
+    summary = Counter()
+    session.preview = {"status": "running", "seconds": 0, "summary": summary}
     try:
-        upload_path = f"static/uploads/{file.filename}"
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        is_video = file.content_type.startswith("video/")
-
-        # Run YOLO
-        results = model.predict(
-            source=upload_path,
-            save=True,
-            conf=0.60,
-            project="static",
-            name="detections",
-            exist_ok=True
-        )
-
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class": model.names[int(box.cls)],
-                    "confidence": float(box.conf)
-                })
-
-        base_name = os.path.splitext(file.filename)[0]
-        output_dir = "static/detections"
-        detected_files = glob.glob(f"{output_dir}/{base_name}*")
-        annotated_path = detected_files[0].replace("\\", "/") if detected_files else None
-
-        if annotated_path and annotated_path.endswith(".avi"):
-            annotated_path = convert_avi_to_mp4(annotated_path)
-
-        summary = Counter([d["class"] for d in detections])
-
-        return JSONResponse({
-            "detections": detections,
-            "summary": summary,
-            "original_image": f"/static/uploads/{file.filename}",
-            "annotated_image": "/" + annotated_path if annotated_path else None,
-            "is_video": is_video
-        })
-
+        with registry.session() as (model, renew):
+            async for event in video.stream_detections(
+                model.pool, session.part_path, None, config.CONFIDENCE,
+                granularity="second", sampling=config.UPLOAD_PREVIEW_SAMPLING, renew=renew
+            ):
+                if event.get("done"):
+                    session.preview.update(status="done", frames=event["frames"],
+                                           analysed_frames=event["analysed_frames"],
+                                           seconds=round(event["frames"] / event["fps"], 1))
+                else:
+                    summary.update(event["summary"])
+                    session.preview["seconds"] = event["second"] + 1
+    except ValueError:
+        session.preview = {"status": "unavailable", "reason": "Container cannot be read before it is complete."}
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        session.preview = {"status": "failed", "reason": str(e)}
 
 
-# ==========================================================
-# ROOT ROUTE
-# ==========================================================
-@app.get("/")
-def root():
-    return {"message": "PPE detection API running!"}
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from ultralytics import YOLO
-from PIL import Image
-import sqlite3
-import io, shutil, os, glob, sys
-from moviepy import VideoFileClip
-from collections import Counter
-
-# ==========================================================
-# Add YOLOv12 folder to PYTHON PATH (for custom model layers)
-# ==========================================================
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'yolov12'))
-
-# ==========================================================
-# FastAPI Application
-# ==========================================================
-app = FastAPI(title="PPE Detection + Auth API", version="2.0")
+def maybe_preview(session: uploads.UploadSession):
+    if (config.UPLOAD_PREVIEW_BYTES and session.kind == "video" and session.preview is None
+            and not session.complete and session.received >= config.UPLOAD_PREVIEW_BYTES):
+        session.preview = {"status": "running"}
+        preview_tasks[session.id] = asyncio.create_task(preview_upload(session))
+        preview_tasks[session.id].add_done_callback(lambda _: preview_tasks.pop(session.id, None))
 
-# ==========================================================
-# CORS Policy
-# ==========================================================
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],          # allow all domains
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# ==========================================================
-# Database Setup / Utility Functions
-# ==========================================================
-DB_FILE = "users.db"
-
-def ensure_user_table():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+def cancel_preview(upload_id: str):
+    task = preview_tasks.pop(upload_id, None)
+    if task is not None:
+        task.cancel()
 
-def register_user(name, email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
 
+@app.post("/api/uploads", status_code=201)
+async def create_upload(body: UploadInit, user: dict | None = Depends(auth.require_user)):
     try:
-        cursor.execute(
-            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-            (name, email, password)
+        session = await asyncio.to_thread(
+            upload_store.create, body.filename, body.size, body.content_type, body.sha256,
+            user["sub"] if user else None
         )
-        conn.commit()
-        return True, "User registered successfully."
-    except sqlite3.IntegrityError:
-        return False, "Email already exists."
-    finally:
-        conn.close()
-
-def check_login(email, password):
-    ensure_user_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, email, password FROM users WHERE email=?", (email,))
-    user = cursor.fetchone()
-    conn.close()
-
-    if not user:
-        return False, "User does not exist. Please sign up first."
-
-    _, _, _, db_password = user
-    if db_password == password:
-        return True, "Login successful."
-    else:
-        return False, "Incorrect password."
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return JSONResponse(session.status(), status_code=201)
+
+
+@app.get("/api/uploads/{upload_id}")
+async def upload_status(upload_id: str, user: dict | None = Depends(auth.require_user)):
+    session = await asyncio.to_thread(owned_upload, upload_id, user)
+    return session.status()
+
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(...),
+    x_chunk_sha256: str | None = Header(None),
+    user: dict | None = Depends(auth.require_user),
+):
+    session = await asyncio.to_thread(owned_upload, upload_id, user)
+    if int(request.headers.get("content-length") or 0) > config.UPLOAD_MAX_CHUNK_BYTES:
+        return JSONResponse({"error": "Chunk is too large.", "offset": session.received}, status_code=413)
+
+    # Chunks are bounded, so one is buffered and checked before it touches the file
+    data = bytearray()
+    async for block in request.stream():
+        data += block
+        if len(data) > config.UPLOAD_MAX_CHUNK_BYTES:
+            return JSONResponse({"error": "Chunk is too large.", "offset": session.received}, status_code=413)
 
+    try:
+        received = await asyncio.to_thread(session.write_chunk, offset, data, x_chunk_sha256)
+    except uploads.UploadError as e:
+        return upload_error(e)
+    maybe_preview(session)
+    return {"offset": received, "complete": session.complete}
+
+
+@app.post("/api/uploads/{upload_id}/finalize", status_code=202)
+async def finalize_upload(
+    upload_id: str,
+    body: UploadFinalize | None = None,
+    user: dict | None = Depends(auth.require_user),
+):
+    session = await asyncio.to_thread(owned_upload, upload_id, user)
+    model = body.model if body else None
+    try:
+        registry.get(model)
+    except UnknownModel as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    cancel_preview(upload_id)
+    place = lambda path, digest: storage.adopt(path, "upload", digest, upload_ext(session.filename))
+    try:
+        upload_path, digest = await asyncio.to_thread(session.finalize, place, body.sha256 if body else None)
+    except uploads.UploadError as e:
+        return upload_error(e)
 
-# ==========================================================
-# User Model
-# ==========================================================
-class User(BaseModel):
-    name: str | None = None
-    email: str
-    password: str
+    try:
+        job_id = await job_queue.submit(session.kind, upload_path, session.filename, digest, session.user_id, model)
+    except jobs.QueueFull as e:
+        # The session stays open, so finalizing again queues the stored file
+        return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
+    upload_store.forget(upload_id)
+    return JSONResponse({"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}",
+                         "sha256": digest, "preview": session.preview}, status_code=202)
+
+
+@app.delete("/api/uploads/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str, user: dict | None = Depends(auth.require_user)):
+    session = await asyncio.to_thread(owned_upload, upload_id, user)
+    cancel_preview(upload_id)
+    await asyncio.to_thread(session.discard)
+    upload_store.forget(upload_id)
+    return Response(status_code=204)
+
+
+# ==========================================================
+# Streaming Video Detection Route (NDJSON or Server-Sent Events)
+# ==========================================================
+@app.post("/api/predict/stream")
+async def predict_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    chunk_size: int | None = Query(None, ge=1, le=256),
+    granularity: str = Query("frame", pattern="^(frame|second)$"),
+    sampling: str | None = Query(None, pattern="^(all|stride|fps|motion)$"),
+    annotate: bool = Query(True),
+    model: str | None = Query(None),
+    user: dict | None = Depends(auth.require_user),
+):
+    try:
+        pool = registry.get(model).pool
+    except UnknownModel as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if pool.pending >= pool.max_pending:
+        return JSONResponse({"error": "Inference queue is full, try again shortly."},
+                            status_code=429, headers={"Retry-After": "1"})
+
+    upload_path, digest = await asyncio.to_thread(save_upload, file)
+    output_path = storage.temp_path(".mp4") if annotate else None
+
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def events():
+        try:
+            # Leased for the whole stream: a hot-swap waits for it to end, and
+            # after MODEL_DRAIN_TIMEOUT the stream moves on to the new version
+            with registry.session(model) as (version, renew):
+                async for event in video.stream_detections(
+                    version.pool, upload_path, output_path, config.CONFIDENCE, chunk_size, granularity, sampling,
+                    renew=renew
+                ):
+                    if event.get("done"):
+                        annotated_path = event.pop("annotated_path")
+                        if annotated_path:
+                            key = cache_key(version, digest, f"stream-{video.signature(sampling)}")
+                            annotated_path = await asyncio.to_thread(
+                                storage.adopt, annotated_path, "annotated", digest, artifact_ext(key, ".mp4")
+                            )
+                        event["original_video"] = "/" + upload_path
+                        event["annotated_video"] = "/" + annotated_path if annotated_path else None
+                        event["model"] = version.name
+                        # The summary adds up boxes over all frames, so one worker would be
+                        # counted once per frame; the most seen at once counts objects
+                        history.record_summary("video", file.filename, event["peak"], user)
+                    line = json.dumps(event)
+                    yield f"data: {line}\n\n" if sse else line + "\n"
+        except Exception as e:
+            line = json.dumps({"error": str(e)})
+            yield f"event: error\ndata: {line}\n\n" if sse else line + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ==========================================================
+# Live Detection over WebSocket (webcam frames or RTSP stream)
+# ==========================================================
+@app.websocket("/api/ws/detect")
+async def live_detect(websocket: WebSocket, annotate: bool = False, model: str | None = None):
+    # Same gate as /api/predict/, checked before the handshake completes
+    try:
+        await auth.websocket_user(websocket)
+    except auth.InvalidToken:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        registry.get(model)
+    except UnknownModel as e:
+        await websocket.send_json({"error": str(e)})
+        await websocket.close(code=1008)
+        return
+    # A hot-swap waits for the session; after MODEL_DRAIN_TIMEOUT it moves on to the new version
+    with registry.session(model) as (version, renew):
+        await live.run_session(websocket, version.pool, annotate, renew)
 
 
 # ==========================================================
-# AUTH ROUTES (Signup + Login)
+# Result Cache Stats
 # ==========================================================
-@app.post("/api/signup")
-async def signup(user: User):
-    success, message = register_user(user.name, user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=201)
-    else:
-        return JSONResponse({"message": message}, status_code=400)
-
-@app.post("/api/login")
-async def login(user: User):
-    success, message = check_login(user.email, user.password)
-    if success:
-        return JSONResponse({"message": message}, status_code=200)
-    else:
-        return JSONResponse({"message": message}, status_code=401)
+@app.get("/api/cache/stats")
+def cache_stats():
+    return result_cache.stats()
 
 
 # ==========================================================
-# Load YOLO Model on Startup ONLY ONCE
+# Prometheus Metrics
 # ==========================================================
-@app.on_event("startup")
-async def load_model():
-    global model
-    weight_path = "weights/best(3).pt"
-
-    if not os.path.exists(weight_path):
-        raise RuntimeError(f"Model file not found: {weight_path}")
-
-    model = YOLO(weight_path)
-    print("🚀 YOLOv12 Model Loaded Successfully!")
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # ==========================================================
-# Static Files Configuration
+# Health / Readiness
 # ==========================================================
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-os.makedirs("static/uploads", exist_ok=True)
-os.makedirs("static/detections", exist_ok=True)
-
+ready = False
 
-# ==========================================================
-# Utility: Convert YOLO .avi to .mp4
-# ==========================================================
-def convert_avi_to_mp4(input_path: str) -> str:
-    if not input_path.lower().endswith(".avi"):
-        return input_path
-
-    output_path = input_path.replace(".avi", ".mp4")
-    with VideoFileClip(input_path) as clip:
-        clip.write_videofile(
-            output_path,
-            codec="libx264",
-            audio_codec="aac",
-            fps=clip.fps or 20
-        )
-    os.remove(input_path)
-    return output_path
+@app.get("/api/health")
+def health():
+    if not ready:
+        return JSONResponse({"ready": False}, status_code=503)
+    default = registry.get()
+    return {
+        "ready": True,
+        "backend": config.MODEL_BACKEND,
+        "precision": config.MODEL_PRECISION,
+        "workers": default.pool.workers,
+        "mode": default.pool.mode,
+        "queue": registry.pending,
+        "default_model": registry.default,
+        "models": sorted(registry.specs),
+    }
 
 
 # ==========================================================
-# PPE Detection Route
+# Model Registry (list for users, load / swap / remove for admins)
 # ==========================================================
-@app.post("/api/predict/")
-async def predict(file: UploadFile = File(...)):
-    try:
-        upload_path = f"static/uploads/{file.filename}"
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        is_video = file.content_type.startswith("video/")
+class ModelLoad(BaseModel):
+    weights: str | None = None      # default: reload the current file
 
-        # Run YOLO
-        results = model.predict(
-            source=upload_path,
-            save=True,
-            conf=0.60,
-            project="static",
-            name="detections",
-            exist_ok=True
-        )
-
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                detections.append({
-                    "class": model.names[int(box.cls)],
-                    "confidence": float(box.conf)
-                })
 
-        base_name = os.path.splitext(file.filename)[0]
-        output_dir = "static/detections"
-        detected_files = glob.glob(f"{output_dir}/{base_name}*")
-        annotated_path = detected_files[0].replace("\\", "/") if detected_files else None
+@app.get("/api/models")
+def list_models(user: dict | None = Depends(auth.require_user)):
+    return registry.describe()
 
-        if annotated_path and annotated_path.endswith(".avi"):
-            annotated_path = convert_avi_to_mp4(annotated_path)
 
-        summary = Counter([d["class"] for d in detections])
+@app.post("/api/models/{name}", status_code=202)
+async def load_model_version(name: str, body: ModelLoad | None = None, _=Depends(auth.require_admin)):
+    weights = body.weights if body else None
+    if name not in registry.specs and not weights:
+        return JSONResponse({"error": f"Weights are required for new model {name}."}, status_code=400)
+    if weights and not os.path.isfile(weights):
+        return JSONResponse({"error": f"Model file not found: {weights}"}, status_code=400)
+    # Loading and warm-up take a while; the current version keeps serving
+    registry.load_in_background(name, weights)
+    return JSONResponse({"status": "loading", "model": name}, status_code=202)
 
-        return JSONResponse({
-            "detections": detections,
-            "summary": summary,
-            "original_image": f"/static/uploads/{file.filename}",
-            "annotated_image": "/" + annotated_path if annotated_path else None,
-            "is_video": is_video
-        })
 
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+@app.delete("/api/models/{name}")
+async def remove_model(name: str, _=Depends(auth.require_admin)):
+    try:
+        await registry.remove(name)
+    except UnknownModel as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {"status": "draining", "model": name}
 
 
 # ==========================================================
@@ -0,0 +1,320 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import config
+import metrics
+import passwords
+import save_user
+
+# ==========================================================
+# Auth service (signup + login), mounted into the FastAPI app.
+# SQLite calls run on a small dedicated thread pool, so they neither
+# block the event loop nor queue behind upload / video work on the
+# default executor. Password hashing (tens of ms of CPU per call) has
+# its own bounded pool so it cannot starve those quick DB calls.
+# ==========================================================
+router = APIRouter(prefix="/api", tags=["auth"])
+
+_executor = None
+_hash_executor = None
+_hash_pending = 0
+_secret = None
+
+
+class HashPoolBusy(Exception):
+    """Raised when every password-hash worker is busy and the queue is full."""
+
+
+def startup():
+    global _executor, _hash_executor, _secret
+    save_user.ensure_table()
+    _executor = ThreadPoolExecutor(max_workers=config.AUTH_WORKERS, thread_name_prefix="auth")
+    _hash_executor = ThreadPoolExecutor(
+        max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+    )
+    _secret = config.AUTH_SECRET.encode() if config.AUTH_SECRET else None
+    if _secret is None:
+        _secret = secrets.token_bytes(32)
+        print("⚠️  AUTH_SECRET is not set; session tokens will not survive a restart.")
+
+
+def shutdown():
+    global _executor, _hash_executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+        _hash_executor = None
+    save_user.close_pool()
+
+
+async def run_db(op, fn, *args):
+    loop = asyncio.get_running_loop()
+    with metrics.DB_SECONDS.time(op=op):
+        return await loop.run_in_executor(_executor, fn, *args)
+
+
+async def run_hash(op, fn, *args):
+    """Run a KDF call on the hash pool; raises HashPoolBusy when it is full."""
+    global _hash_pending
+    if _hash_pending >= config.PASSWORD_HASH_WORKERS + config.PASSWORD_HASH_QUEUE_SIZE:
+        raise HashPoolBusy("Too many logins in progress, try again shortly.")
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        with metrics.PASSWORD_HASH_SECONDS.time(op=op):
+            return await loop.run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+def busy_response(e):
+    return JSONResponse({"message": str(e)}, status_code=429, headers={"Retry-After": "1"})
+
+
+# ==========================================================
+# Signed session tokens
+# <base64url(json claims)>.<base64url(HMAC-SHA256(claims))>
+# Verifying one is a hash and a dict lookup, no database access.
+# ==========================================================
+class InvalidToken(Exception):
+    """Raised when a token is malformed, tampered with or expired."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest()
+
+
+def issue_token(user, ttl=None):
+    now = int(time.time())
+    claims = {
+        "sub": user["id"],
+        "email": user["email"],
+        "name": user["name"],
+        "iat": now,
+        "exp": now + (ttl or config.AUTH_TOKEN_TTL),
+        "jti": secrets.token_hex(12),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_b64encode(_sign(payload))}", claims
+
+
+def decode_token(token):
+    """Return the token's claims if the signature and expiry check out."""
+    try:
+        payload, signature = token.split(".")
+        valid = hmac.compare_digest(_b64decode(signature), _sign(payload))
+    except (ValueError, TypeError):
+        raise InvalidToken("Malformed token.")
+    if not valid:
+        raise InvalidToken("Invalid token signature.")
+    claims = json.loads(_b64decode(payload))
+    if claims.get("exp", 0) < time.time():
+        raise InvalidToken("Token has expired.")
+    return claims
+
+
+class RevocationCache:
+    """jti -> revoked flag, remembered for AUTH_REVOCATION_TTL seconds, so
+    a token costs at most one SQLite lookup per TTL window."""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = config.AUTH_REVOCATION_TTL if ttl is None else ttl
+        self.max_entries = max_entries or config.AUTH_REVOCATION_CACHE_SIZE
+        self._entries = OrderedDict()   # jti -> (revoked, expires_monotonic)
+        self._lock = threading.Lock()
+
+    def get(self, jti):
+        with self._lock:
+            item = self._entries.get(jti)
+            if item is None:
+                return None
+            if item[1] < time.monotonic():
+                del self._entries[jti]
+                return None
+            return item[0]
+
+    def put(self, jti, revoked):
+        with self._lock:
+            self._entries.pop(jti, None)
+            self._entries[jti] = (revoked, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+revocations = RevocationCache()
+
+
+async def verify_token(token):
+    claims = decode_token(token)
+    revoked = revocations.get(claims["jti"])
+    if revoked is None:
+        revoked = await run_db("revocation_check", save_user.is_token_revoked, claims["jti"])
+        revocations.put(claims["jti"], revoked)
+    if revoked:
+        raise InvalidToken("Token has been revoked.")
+    return claims
+
+
+def bearer_token(authorization):
+    scheme, _, token = (authorization or "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+
+def unauthorized(message):
+    return HTTPException(status_code=401, detail=message, headers={"WWW-Authenticate": "Bearer"})
+
+
+async def require_user(authorization: str | None = Header(None)):
+    """FastAPI dependency for protected endpoints; returns the token claims.
+
+    With AUTH_REQUIRED=0 requests without a token are let through (None).
+    """
+    token = bearer_token(authorization)
+    if token is None:
+        if not config.AUTH_REQUIRED:
+            return None
+        raise unauthorized("Login required.")
+    try:
+        return await verify_token(token)
+    except InvalidToken as e:
+        raise unauthorized(str(e))
+
+
+async def websocket_user(websocket):
+    """require_user for a WebSocket handshake; raises InvalidToken.
+
+    Browsers cannot set headers on a WebSocket, so the token may also
+    come as ``?token=``.
+    """
+    token = websocket.query_params.get("token") or bearer_token(websocket.headers.get("authorization"))
+    if token is None:
+        if not config.AUTH_REQUIRED:
+            return None
+        raise InvalidToken("Login required.")
+    return await verify_token(token)
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    """FastAPI dependency for operator endpoints (X-Admin-Token == ADMIN_TOKEN)."""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set).")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+# ==========================================================
+# User Model
+# ==========================================================
+class User(BaseModel):
+    name: str | None = None
+    username: str | None = None     # accepted for clients of the old Flask service
+    email: str
+    password: str
+
+
+def missing_credentials(user: User):
+    if not user.email or not user.password:
+        return JSONResponse({"message": "Email and password required."}, status_code=400)
+    return None
+
+
+# ==========================================================
+# AUTH ROUTES (Signup + Login + Logout)
+# ==========================================================
+async def authenticate(email, password):
+    """Async counterpart of save_user.authenticate: DB lookups on the DB
+    pool, verification and any rehash on the hash pool."""
+    account = await run_db("login", save_user.get_user, email)
+    if not account:
+        return None, "User does not exist. Please sign up first."
+
+    stored = account.pop("password")
+    matches, needs_rehash = await run_hash("verify", passwords.verify_password, password, stored)
+    if not matches:
+        return None, "Incorrect password."
+    if needs_rehash:
+        # Legacy plaintext row or old cost settings: upgrade transparently.
+        # If the hash pool is saturated the upgrade waits for a later login.
+        try:
+            upgraded = await run_hash("hash", passwords.hash_password, password)
+            await run_db("rehash", save_user.update_password, account["id"], upgraded)
+        except HashPoolBusy:
+            pass
+    return account, "Login successful."
+
+
+@router.post("/signup")
+async def signup(user: User):
+    error = missing_credentials(user)
+    if error:
+        return error
+    try:
+        password_hash = await run_hash("hash", passwords.hash_password, user.password)
+    except HashPoolBusy as e:
+        return busy_response(e)
+    success, message = await run_db(
+        "signup", save_user.register_user, user.name or user.username, user.email, password_hash
+    )
+    if success:
+        return JSONResponse({"message": message}, status_code=201)
+    else:
+        return JSONResponse({"message": message}, status_code=400)
+
+
+@router.post("/login")
+async def login(user: User):
+    error = missing_credentials(user)
+    if error:
+        return error
+    try:
+        account, message = await authenticate(user.email, user.password)
+    except HashPoolBusy as e:
+        return busy_response(e)
+    if account:
+        token, claims = issue_token(account)
+        return JSONResponse({
+            "message": message,
+            "name": account["name"] or "",
+            "token": token,
+            "token_type": "bearer",
+            "expires_at": claims["exp"],
+        }, status_code=200)
+    else:
+        return JSONResponse({"message": message}, status_code=401)
+
+
+@router.post("/logout")
+async def logout(authorization: str | None = Header(None)):
+    token = bearer_token(authorization)
+    if token is None:
+        raise unauthorized("Login required.")
+    try:
+        claims = decode_token(token)
+    except InvalidToken:
+        # Already unusable, nothing to revoke
+        return {"message": "Logged out."}
+    await run_db("revoke", save_user.revoke_token, claims["jti"], claims["exp"])
+    revocations.put(claims["jti"], True)
+    return {"message": "Logged out."}
@@ -0,0 +1,117 @@
+import os
+import shutil
+
+import cache
+import config
+
+# ==========================================================
+# Model backends
+# MODEL_BACKEND=pytorch | onnx | openvino
+# MODEL_PRECISION=fp32 | fp16 | int8
+#
+# Exported models are written next to the .pt file once and reused on
+# the next start, e.g. weights/best(3)_3f2a9c1e04b7_640_int8.onnx or
+# weights/best(3)_3f2a9c1e04b7_640_fp16_openvino_model/. The name holds
+# the weight file's digest and imgsz, so new weights at the same path
+# (or another input size) get a fresh export instead of a stale one.
+# ==========================================================
+SUPPORTED = {
+    "pytorch": ("fp32",),
+    "onnx": ("fp32", "int8"),          # fp16 ONNX export needs a GPU
+    "openvino": ("fp32", "fp16", "int8"),
+}
+
+
+def exported_path(weight_path, backend, precision, imgsz):
+    if backend == "pytorch":
+        return weight_path
+    stem = f"{os.path.splitext(weight_path)[0]}_{cache.file_digest(weight_path)[:12]}_{imgsz}_{precision}"
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    return f"{stem}_openvino_model"
+
+
+def prepare_weights(weight_path, backend=None, precision=None, imgsz=None):
+    """Return the path the workers should load, exporting it if needed.
+
+    Runs in the API process before the pool starts, so the export
+    happens once rather than once per worker.
+    """
+    backend = backend or config.MODEL_BACKEND
+    precision = precision or config.MODEL_PRECISION
+    imgsz = imgsz or config.MODEL_IMGSZ
+
+    if backend not in SUPPORTED:
+        raise ValueError(f"Unknown MODEL_BACKEND: {backend}")
+    if precision not in SUPPORTED[backend]:
+        raise ValueError(
+            f"{backend} does not support {precision} on CPU "
+            f"(supported: {', '.join(SUPPORTED[backend])})"
+        )
+
+    target = exported_path(weight_path, backend, precision, imgsz)
+    if os.path.exists(target):
+        return target
+
+    from ultralytics import YOLO
+
+    print(f"📦 Exporting {weight_path} to {backend} ({precision}) ...")
+    model = YOLO(weight_path)
+
+    if backend == "onnx":
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if precision == "int8":
+            # Dynamic (weight-only) quantization needs no calibration data
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+        else:
+            shutil.move(exported, target)
+        return target
+
+    # openvino
+    kwargs = {"half": precision == "fp16", "int8": precision == "int8"}
+    if precision == "int8" and config.MODEL_INT8_DATA:
+        kwargs["data"] = config.MODEL_INT8_DATA    # calibration dataset yaml
+    exported = model.export(format="openvino", imgsz=imgsz, **kwargs)
+    shutil.move(exported, target)
+    return target
+
+
+def set_runtime_threads(model, path, backend, threads):
+    """Best effort: rebuild the ONNX Runtime session / OpenVINO compiled
+    model with an explicit thread count once the predictor exists.
+
+    Ultralytics creates these with library defaults (all cores), which
+    oversubscribes the CPU when several workers run side by side.
+    """
+    runtime = getattr(getattr(model, "predictor", None), "model", None)
+    if runtime is None:
+        return False
+    # Newer ultralytics keeps the runtime objects on a nested backend
+    runtime = getattr(runtime, "backend", None) or runtime
+
+    if backend == "onnx" and getattr(runtime, "session", None) is not None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        runtime.session = ort.InferenceSession(
+            path, options,
+            providers=runtime.session.get_providers()
+        )
+        return True
+
+    if backend == "openvino" and getattr(runtime, "ov_compiled_model", None) is not None:
+        import openvino as ov
+
+        xml = next(f for f in os.listdir(path) if f.endswith(".xml"))
+        core = ov.Core()
+        runtime.ov_compiled_model = core.compile_model(
+            core.read_model(os.path.join(path, xml)), "CPU",
+            {"INFERENCE_NUM_THREADS": threads, "PERFORMANCE_HINT": "LATENCY"}
+        )
+        return True
+
+    return False
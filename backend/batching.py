@@ -0,0 +1,101 @@
+import asyncio
+
+import config
+import inference
+from inference import PoolBusy, PoolClosed
+
+# ==========================================================
+# Dynamic micro-batching for single-image requests
+# Concurrent requests are collected for up to BATCH_MAX_WAIT_MS
+# or BATCH_MAX_SIZE images and sent to the pool as one forward pass.
+# ==========================================================
+class MicroBatcher:
+    def __init__(self, pool, fn=inference.predict_batch, max_batch=None, max_wait_ms=None, conf=None):
+        self.pool = pool
+        self.fn = fn
+        self.max_batch = max_batch or config.BATCH_MAX_SIZE
+        self.max_wait = (config.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.conf = conf or config.CONFIDENCE
+
+        # Enough room for a full batch behind every pool slot; beyond
+        # that callers get the same 429 the pool would give them
+        self._queue = asyncio.Queue(maxsize=pool.max_pending * self.max_batch)
+        self._task = None
+        self._running = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Requests that were never collected would otherwise wait forever
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(PoolClosed("Model was reloaded, try again."))
+
+    async def submit(self, source):
+        """Queue one image and wait for its own result from ``fn``."""
+        if self._task is None:
+            raise PoolClosed("Model was reloaded, try again.")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((source, future))
+        except asyncio.QueueFull:
+            raise PoolBusy("Inference queue is full, try again shortly.")
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                getter = asyncio.ensure_future(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=remaining)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                batch.append(getter.result())
+
+            # Keep collecting the next batch while this one runs
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        sources = [source for source, _ in batch]
+        try:
+            results = await self.pool.run(self.fn, sources, self.conf)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if len(results) != len(batch):
+            # Never hand one caller another caller's result
+            e = RuntimeError(f"Batch returned {len(results)} results for {len(batch)} images.")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away (client disconnect)
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)    # this item only, e.g. an unreadable upload
+            else:
+                future.set_result(result)
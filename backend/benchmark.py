@@ -0,0 +1,521 @@
+"""
+Inference benchmark for the PPE detection pipeline.
+
+Run from the backend folder, e.g.
+
+    python benchmark.py --iterations 50 --concurrency 4
+    python benchmark.py --backend onnx --precision int8 --tag onnx-int8
+    python benchmark.py --skip-stages --skip-endpoint --login-costs 12,14,15
+    python benchmark.py --skip-stages --skip-endpoint --skip-login --tile-sizes 640,960
+
+It reports latency percentiles and throughput for /api/predict/ (images
+and a synthetic video), peak RSS, a per-stage breakdown of a single
+request, tiled vs. full-frame latency and small-object recall on
+synthetic 4K scenes and login throughput per password-hash cost, and writes
+everything to bench_results/<timestamp>-<tag>.json so runs can be
+compared across weights and backends.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+# ==========================================================
+# Helpers
+# ==========================================================
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": round(pick(0.50) * 1000, 2),
+        "p95_ms": round(pick(0.95) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux (bytes on macOS)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"self_mb": round(own, 1), "children_mb": round(children, 1)}
+
+
+def timed(stages, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    stages.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+
+def load_images(folder):
+    exts = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+    paths = sorted(p for p in glob.glob(os.path.join(folder, "*")) if p.lower().endswith(exts))
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def make_synthetic_video(path, image_bytes, seconds, fps, width=1280, height=720):
+    """A site-camera-like clip: a still background with one moving block."""
+    import cv2
+    import numpy as np
+
+    background = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    background = cv2.resize(background, (width, height))
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    frames = int(seconds * fps)
+    for i in range(frames):
+        frame = background.copy()
+        x = int((width - 120) * i / max(1, frames - 1))
+        cv2.rectangle(frame, (x, height // 3), (x + 120, height // 3 + 240), (0, 200, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return frames
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def upload_file(name, data, content_type):
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    return UploadFile(file=io.BytesIO(data), filename=name,
+                      headers=Headers({"content-type": content_type}))
+
+
+def load_worker_model():
+    """Load the model the way a pool worker does, on the configured
+    backend (exporting ONNX / OpenVINO weights first if needed)."""
+    import backends
+    import config
+    import inference
+
+    weights = backends.prepare_weights(config.WEIGHT_PATH)
+    inference._init_worker(weights, config.MODEL_BACKEND, config.MODEL_THREADS or os.cpu_count())
+    return inference.get_model()
+
+
+# ==========================================================
+# Per-stage breakdown of one request, outside the API
+# ==========================================================
+def bench_stages(images, video_path, iterations):
+    import cv2
+    import numpy as np
+
+    import config
+    import inference
+    import video
+    from storage import Storage
+
+    model = load_worker_model()
+    stages = {}
+    scratch = tempfile.mkdtemp(prefix="bench_")
+    store = Storage(os.path.join(scratch, "storage.db"),
+                    {"upload": os.path.join(scratch, "uploads"), "annotated": os.path.join(scratch, "detections")})
+
+    try:
+        for i in range(iterations):
+            name, data = images[i % len(images)]
+            digest = timed(stages, "upload_hash", lambda: hashlib.sha256(data).hexdigest())
+            upload_path = store.path_for("upload", digest, os.path.splitext(name)[1])
+
+            timed(stages, "upload_write", write_file, upload_path, data)
+            frame = timed(stages, "decode", cv2.imdecode, np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            r = timed(stages, "inference", model.predict, frame, conf=config.CONFIDENCE, verbose=False)[0]
+            for key in ("preprocess", "inference", "postprocess"):
+                stages.setdefault(f"model_{key}", []).append(r.speed[key] / 1000)
+            annotated = timed(stages, "annotation", r.plot)
+            encoded = timed(stages, "annotated_encode", inference.encode_jpeg, annotated)
+            annotated_path = store.path_for("annotated", digest, ".jpg")
+            write_file(annotated_path, encoded)
+            timed(stages, "artifact_index", store.add, annotated_path, "annotated", digest)
+            timed(stages, "artifact_lookup", store.lookup, "annotated", digest)
+            detections = inference.result_detections(r, model.names)
+            timed(stages, "json_serialization", json.dumps, {"detections": detections})
+
+        # Video output: legacy AVI + moviepy re-encode vs. the direct MP4 writer
+        info = video.video_info(video_path)
+        frames = [f for _, chunk in video.iter_frame_chunks(video_path, 64) for f in chunk]
+
+        def write_avi(path):
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"XVID"), info["fps"],
+                                     (info["width"], info["height"]))
+            for f in frames:
+                writer.write(f)
+            writer.release()
+
+        avi_path = os.path.join(scratch, "legacy.avi")
+        timed(stages, "video_avi_write", write_avi, avi_path)
+        timed(stages, "video_avi_to_mp4", video.convert_avi_to_mp4, avi_path)
+
+        def write_direct():
+            writer = video.AnnotatedWriter(os.path.join(scratch, "direct.mp4"), info["fps"])
+            writer.write(frames)
+            writer.close()
+
+        timed(stages, "video_direct_mp4", write_direct)
+    finally:
+        store.pool.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {name: percentiles(samples) for name, samples in stages.items()}
+
+
+# ==========================================================
+# End-to-end: drive predict() itself
+# ==========================================================
+async def bench_endpoint(images, video_path, iterations, concurrency, video_runs):
+    import app as api
+
+    await api.load_model()
+    try:
+        async def one(name, data, content_type):
+            start = time.perf_counter()
+            response = await api.predict(
+                file=upload_file(name, data, content_type),
+                in_memory=None, save=None, output="json", model=None, accept=None, user=None
+            )
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"predict() returned {response.status_code}: {response.body[:200]}")
+            return elapsed
+
+        # Images, `concurrency` requests in flight at a time
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(i):
+            async with semaphore:
+                name, data = images[i % len(images)]
+                latencies.append(await one(f"bench_{i}_{name}", data, "image/jpeg"))
+
+        wall = time.perf_counter()
+        await asyncio.gather(*(limited(i) for i in range(iterations)))
+        wall = time.perf_counter() - wall
+        image_result = {
+            "latency": percentiles(latencies),
+            "images_per_sec": round(iterations / wall, 2),
+            "concurrency": concurrency,
+        }
+
+        # Video, sequential
+        with open(video_path, "rb") as f:
+            video_bytes = f.read()
+        frames = api.video.video_info(video_path)["frames"]
+        video_latencies = []
+        for i in range(video_runs):
+            video_latencies.append(await one(f"bench_video_{i}.mp4", video_bytes, "video/mp4"))
+        video_result = {
+            "latency": percentiles(video_latencies),
+            "frames": frames,
+            "frames_per_sec": round(frames * video_runs / sum(video_latencies), 2),
+        }
+        return {"image": image_result, "video": video_result}
+    finally:
+        await api.unload_model()
+
+
+# ==========================================================
+# Tiled inference: latency cost vs. small-object recall
+# ==========================================================
+def make_site_frame(image, reference, object_px, width=3840, height=2160):
+    """Paste shrunken copies of ``image`` onto a 4K canvas so that its
+    detections are about ``object_px`` tall, like workers far from a
+    wide-angle camera. Returns the frame and the expected boxes."""
+    import cv2
+    import numpy as np
+
+    heights = sorted(y2 - y1 for _, y1, _, y2, _ in reference)
+    scale = object_px / heights[len(heights) // 2]
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    sh, sw = small.shape[:2]
+    frame = np.full((height, width, 3), 114, np.uint8)
+    truth = []
+    gap = max(8, object_px)
+    for top in range(gap, height - sh, sh + gap):
+        for left in range(gap, width - sw, sw + gap):
+            frame[top:top + sh, left:left + sw] = small
+            truth.extend((left + x1 * scale, top + y1 * scale, left + x2 * scale, top + y2 * scale, c)
+                         for x1, y1, x2, y2, c in reference)
+    return frame, truth
+
+
+def recall(truth, predicted, iou=0.5):
+    """Share of expected boxes matched by a prediction of the same class."""
+    import numpy as np
+
+    if not truth:
+        return None
+    if not predicted:
+        return 0.0
+    t = np.asarray(truth, dtype=np.float32)
+    p = np.asarray(predicted, dtype=np.float32)
+    w = np.clip(np.minimum(t[:, None, 2], p[None, :, 2]) - np.maximum(t[:, None, 0], p[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(t[:, None, 3], p[None, :, 3]) - np.maximum(t[:, None, 1], p[None, :, 1]), 0, None)
+    inter = w * h
+    area_t = (t[:, 2] - t[:, 0]) * (t[:, 3] - t[:, 1])
+    area_p = (p[:, 2] - p[:, 0]) * (p[:, 3] - p[:, 1])
+    overlap = inter / (area_t[:, None] + area_p[None, :] - inter)
+    same_class = t[:, None, 4] == p[None, :, 4]
+    return round(float(((overlap >= iou) & same_class).any(axis=1).mean()), 4)
+
+
+def bench_tiling(images, iterations, tile_sizes, object_px):
+    import cv2
+    import numpy as np
+
+    import config
+    import tiling
+
+    model = load_worker_model()
+
+    def boxes(r):
+        return [(*xyxy, c) for xyxy, c in zip(r.boxes.xyxy.tolist(), r.boxes.cls.tolist())]
+
+    # Full-resolution detections of the originals are the expected boxes
+    scenes = []
+    for _, data in images:
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        reference = boxes(model.predict(image, conf=config.CONFIDENCE, verbose=False)[0])
+        if reference:
+            scenes.append(make_site_frame(image, reference, object_px))
+    if not scenes:
+        return {"skipped": "no detections in the test images to build small-object scenes from"}
+
+    saved = (config.TILE_INFERENCE, config.TILE_SIZE)
+    modes = [("full_frame", 0, config.TILE_SIZE)] + [(f"tiled_{size}", 1, size) for size in tile_sizes]
+    results = {}
+    try:
+        for name, enabled, size in modes:
+            config.TILE_INFERENCE, config.TILE_SIZE = enabled, size
+            latencies, recalls, counts = [], [], []
+            for i in range(iterations):
+                frame, truth = scenes[i % len(scenes)]
+                start = time.perf_counter()
+                r = tiling.predict(model, [frame], config.CONFIDENCE)[0]
+                latencies.append(time.perf_counter() - start)
+                predicted = boxes(r)
+                recalls.append(recall(truth, predicted))
+                counts.append(len(predicted))
+            h, w = scenes[0][0].shape[:2]
+            results[name] = {
+                "latency": percentiles(latencies),
+                "recall": round(statistics.fmean(recalls), 4),
+                "detections": round(statistics.fmean(counts), 1),
+                "tiles": len(tiling.windows(w, h, size, int(size * config.TILE_OVERLAP))) if enabled else 0,
+            }
+    finally:
+        config.TILE_INFERENCE, config.TILE_SIZE = saved
+
+    return {
+        "frame": "3840x2160",
+        "object_px": object_px,
+        "expected_boxes": statistics.fmean(len(truth) for _, truth in scenes),
+        "overlap": config.TILE_OVERLAP,
+        "full_frame_pass": bool(config.TILE_FULL_FRAME),
+        "nms": f"{config.TILE_NMS_METRIC}>{config.TILE_NMS_THRESHOLD}",
+        "modes": results,
+    }
+
+
+# ==========================================================
+# Login throughput per password-hash cost
+# ==========================================================
+async def bench_login(costs, logins, concurrency):
+    import auth
+    import config
+    import passwords
+    import save_user
+
+    password = "bench-password"
+    auth.startup()
+    try:
+        results = {}
+        for cost in costs:
+            config.PASSWORD_HASH_COST = cost
+            email = f"bench-{cost}@example.com"
+            single = time.perf_counter()
+            save_user.register_user("bench", email, passwords.hash_password(password))
+            single = time.perf_counter() - single
+
+            # How late a 10 ms timer fires while logins run = event loop stall
+            lag = {"max": 0.0}
+            done = asyncio.Event()
+
+            async def probe():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lag["max"] = max(lag["max"], time.perf_counter() - start - 0.01)
+
+            latencies = []
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await auth.login(auth.User(email=email, password=password))
+                    if response.status_code != 200:
+                        raise RuntimeError(f"login() returned {response.status_code}: {response.body[:200]}")
+                    latencies.append(time.perf_counter() - start)
+
+            prober = asyncio.create_task(probe())
+            wall = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(logins)))
+            wall = time.perf_counter() - wall
+            done.set()
+            await prober
+
+            results[str(cost)] = {
+                "hash_ms": round(single * 1000, 2),
+                "latency": percentiles(latencies),
+                "logins_per_sec": round(logins / wall, 2),
+                "max_loop_lag_ms": round(lag["max"] * 1000, 2),
+            }
+
+        # A legacy plaintext row is upgraded on its first login
+        save_user.register_user("legacy", "bench-legacy@example.com", password)
+        await auth.login(auth.User(email="bench-legacy@example.com", password=password))
+        stored = save_user.get_user("bench-legacy@example.com")["password"]
+        return {
+            "concurrency": concurrency,
+            "hash_workers": config.PASSWORD_HASH_WORKERS,
+            "costs": results,
+            "legacy_row_rehashed": passwords.is_hashed(stored),
+        }
+    finally:
+        auth.shutdown()
+
+
+# ==========================================================
+# Entry point
+# ==========================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PPE detection pipeline.")
+    parser.add_argument("--images", default="static/uploads", help="folder with test images")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--video-seconds", type=float, default=5)
+    parser.add_argument("--video-fps", type=int, default=15)
+    parser.add_argument("--video-runs", type=int, default=2)
+    parser.add_argument("--weights", help="overrides WEIGHT_PATH")
+    parser.add_argument("--backend", help="overrides MODEL_BACKEND")
+    parser.add_argument("--precision", help="overrides MODEL_PRECISION")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-endpoint", action="store_true")
+    parser.add_argument("--login-costs", default="12,14,15",
+                        help="comma separated PASSWORD_HASH_COST values to benchmark")
+    parser.add_argument("--logins", type=int, default=20, help="logins per cost setting")
+    parser.add_argument("--skip-login", action="store_true")
+    parser.add_argument("--tile-sizes", default="640,960",
+                        help="comma separated TILE_SIZE values to compare with full-frame inference")
+    parser.add_argument("--tile-object-px", type=int, default=32,
+                        help="height of the objects in the synthetic 4K scenes")
+    parser.add_argument("--skip-tiling", action="store_true")
+    parser.add_argument("--tag", default="", help="label stored with the results")
+    parser.add_argument("--out", default="bench_results")
+    args = parser.parse_args()
+
+    # Must be set before config is imported
+    for env, value in (("WEIGHT_PATH", args.weights), ("MODEL_BACKEND", args.backend),
+                       ("MODEL_PRECISION", args.precision)):
+        if value:
+            os.environ[env] = value
+    os.environ["CACHE_MAX_ENTRIES"] = "0"   # measure the model, not the cache
+    scratch = tempfile.mkdtemp(prefix="bench_run_")
+    os.environ["AUTH_DB_FILE"] = os.path.join(scratch, "bench_users.db")
+    os.environ["STORAGE_DB_FILE"] = os.path.join(scratch, "bench_storage.db")
+    os.environ["HISTORY_DB_FILE"] = os.path.join(scratch, "bench_history.db")
+    os.environ["JOBS_DB_FILE"] = os.path.join(scratch, "bench_jobs.db")
+
+    import config
+    import storage
+
+    # Stored files are shared by every upload of the same bytes, so the
+    # benchmark keeps its own under the scratch directory
+    storage.ROOTS = {"upload": os.path.join(scratch, "uploads"), "annotated": os.path.join(scratch, "detections")}
+
+    images = load_images(args.images)
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    video_path = os.path.join(scratch, "synthetic.mp4")
+    make_synthetic_video(video_path, images[0][1], args.video_seconds, args.video_fps)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "tag": args.tag,
+        "config": {
+            "weights": config.WEIGHT_PATH,
+            "backend": config.MODEL_BACKEND,
+            "precision": config.MODEL_PRECISION,
+            "inference_mode": config.INFERENCE_MODE,
+            "workers": config.INFERENCE_WORKERS,
+            "batch_max_size": config.BATCH_MAX_SIZE,
+            "confidence": config.CONFIDENCE,
+            "cpu_count": os.cpu_count(),
+        },
+        "inputs": {"images": len(images), "video_seconds": args.video_seconds, "video_fps": args.video_fps},
+    }
+
+    try:
+        if not args.skip_stages:
+            print("⏱️  Per-stage breakdown ...")
+            report["stages"] = bench_stages(images, video_path, args.iterations)
+        if not args.skip_endpoint:
+            print("⏱️  End-to-end predict() ...")
+            report["endpoint"] = asyncio.run(
+                bench_endpoint(images, video_path, args.iterations, args.concurrency, args.video_runs)
+            )
+        if not args.skip_tiling:
+            print("⏱️  Tiled vs. full-frame inference on 4K scenes ...")
+            sizes = [int(size) for size in args.tile_sizes.split(",") if size.strip()]
+            report["tiling"] = bench_tiling(images, max(3, args.iterations // 5), sizes, args.tile_object_px)
+        if not args.skip_login:
+            print("⏱️  Login throughput per hash cost ...")
+            costs = [int(c) for c in args.login_costs.split(",") if c.strip()]
+            report["login"] = asyncio.run(bench_login(costs, args.logins, args.concurrency))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    report["peak_rss"] = peak_rss_mb()
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out_path = os.path.join(args.out, f"{stamp}{'-' + args.tag if args.tag else ''}.json")
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"✅ Results saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
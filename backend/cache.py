@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import config
+
+# ==========================================================
+# Cache keys
+# ==========================================================
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def model_fingerprint(weight_path):
+    """Identifies the weights, so swapping the file invalidates old entries."""
+    return file_digest(weight_path)[:16]
+
+
+def make_key(upload_digest, fingerprint, conf, variant=""):
+    return hashlib.sha256(f"{upload_digest}|{fingerprint}|{conf}|{variant}".encode()).hexdigest()
+
+
+# ==========================================================
+# Content-addressed result cache
+# In-memory LRU bounded by entries and bytes, with an optional
+# on-disk tier (CACHE_DIR) that survives restarts.
+# ==========================================================
+class ResultCache:
+    def __init__(self, max_entries=None, max_bytes=None, disk_dir=None, disk_max_bytes=None):
+        self.max_entries = config.CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = config.CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.disk_dir = config.CACHE_DIR if disk_dir is None else disk_dir
+        self.disk_max_bytes = config.CACHE_DISK_MAX_MB * 1024 * 1024 if disk_max_bytes is None else disk_max_bytes
+
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(self.disk_dir) if e.is_file())
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    # ------------------------------------------------------
+    # Values are the JSON response payloads of /api/predict/
+    # ------------------------------------------------------
+    @staticmethod
+    def _encode(value):
+        return json.dumps(value).encode()
+
+    @staticmethod
+    def _artifacts_exist(value):
+        # An entry is only valid while the files it points to exist
+        for field in ("annotated_image", "original_image"):
+            url = value.get(field)
+            if url and url.startswith("/static/") and not os.path.exists(url[1:]):
+                return False
+        return True
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if self._artifacts_exist(item[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return item[0]
+                self._drop(key)
+
+        value = self._disk_get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+            self._memory_put(key, value, self._encode(value))
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        raw = self._encode(value)
+        self._memory_put(key, value, raw)
+        self._disk_put(key, raw)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    # ------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------
+    def _drop(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _memory_put(self, key, value, raw):
+        size = len(raw)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    # ------------------------------------------------------
+    # Disk tier: one file per key, oldest-used evicted first
+    # ------------------------------------------------------
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        if not self._artifacts_exist(value):
+            return None
+        os.utime(path)  # mark as recently used
+        return value
+
+    def _disk_put(self, key, raw):
+        if not self.disk_dir or len(raw) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._disk_bytes += len(raw)
+            if self._disk_bytes <= self.disk_max_bytes:
+                return
+        self._disk_evict()
+
+    def _disk_evict(self):
+        files = sorted(
+            (e for e in os.scandir(self.disk_dir) if e.is_file()),
+            key=lambda e: e.stat().st_mtime
+        )
+        total = sum(e.stat().st_size for e in files)
+        for entry in files:
+            if total <= self.disk_max_bytes * 0.9:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            self.evictions += 1
+        with self._lock:
+            self._disk_bytes = total
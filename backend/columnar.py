@@ -0,0 +1,201 @@
+import base64
+import json
+from collections import Counter
+
+import numpy as np
+
+# ==========================================================
+# Compact columnar detection results
+# Instead of one {"class", "confidence"} dict per box, a result is a
+# handful of NumPy columns filled straight from the r.boxes tensors:
+#   classes      class-name table, indexed by class_id
+#   class_id     int16  (n,)
+#   confidence   float32 (n,)
+#   box          float32 (n, 4)  x1, y1, x2, y2 in pixels
+#   frame        int32  (n,)     videos only
+# The client picks the encoding with its Accept header.
+# ==========================================================
+MEDIA_TYPES = {
+    "json": "application/vnd.ppe.columnar+json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+ALIASES = {
+    "application/vnd.ppe.columnar+json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+PACKAGES = {"msgpack": "msgpack", "arrow": "pyarrow"}    # pip name of each optional encoder
+DTYPES = {"frame": "<i4", "class_id": "<i2", "confidence": "<f4", "box": "<f4"}
+
+
+class NotAcceptable(Exception):
+    """Raised when the client only accepts encodings that are not installed."""
+
+
+def available(fmt):
+    try:
+        if fmt == "msgpack":
+            import msgpack  # noqa: F401
+        elif fmt == "arrow":
+            import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate(accept):
+    """Columnar encoding requested by an Accept header, or None for the
+    regular JSON payload. Media types are tried by descending q-value."""
+    if not accept:
+        return None
+    ranked = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranked.append((-q, position, media_type.lower()))
+
+    missing = []
+    for _, _, media_type in sorted(ranked):
+        fmt = ALIASES.get(media_type)
+        if fmt is None:
+            if media_type in ("application/json", "application/*", "*/*"):
+                return None
+            continue
+        if available(fmt):
+            return fmt
+        if fmt not in missing:
+            missing.append(fmt)
+    if missing:
+        packages = " / ".join(PACKAGES[fmt] for fmt in missing)
+        raise NotAcceptable(f"Install the {packages} package to get {' or '.join(missing)} results.")
+    return None
+
+
+# ----------------------------------------------------------
+# Building columns
+# ----------------------------------------------------------
+def empty(classes):
+    return {
+        "classes": list(classes),
+        "class_id": np.zeros(0, np.int16),
+        "confidence": np.zeros(0, np.float32),
+        "box": np.zeros((0, 4), np.float32),
+    }
+
+
+def concat(blocks, frames):
+    """One video-wide block from per-frame blocks and their frame indices."""
+    if not blocks:
+        return {**empty([]), "frame": np.zeros(0, np.int32)}
+    counts = [len(block["class_id"]) for block in blocks]
+    return {
+        "classes": blocks[0]["classes"],
+        "frame": np.repeat(np.asarray(frames, np.int32), counts),
+        "class_id": np.concatenate([block["class_id"] for block in blocks]),
+        "confidence": np.concatenate([block["confidence"] for block in blocks]),
+        "box": np.concatenate([block["box"] for block in blocks]).reshape(-1, 4),
+    }
+
+
+def class_counts(columns):
+    """Summary ({class: boxes}) without touching individual boxes."""
+    counts = np.bincount(columns["class_id"].astype(np.int64), minlength=len(columns["classes"]))
+    return Counter({columns["classes"][i]: int(n) for i, n in enumerate(counts) if n})
+
+
+def _fields(columns):
+    return [name for name in ("frame", "class_id", "confidence", "box") if name in columns]
+
+
+# ----------------------------------------------------------
+# Cache form: the result cache stores JSON, so arrays travel as
+# base64 of their raw little-endian bytes
+# ----------------------------------------------------------
+def pack(columns):
+    packed = {"classes": columns["classes"], "count": int(len(columns["class_id"]))}
+    for name in _fields(columns):
+        array = np.ascontiguousarray(columns[name], dtype=DTYPES[name])
+        packed[name] = {"dtype": DTYPES[name], "shape": list(array.shape),
+                        "data": base64.b64encode(array.tobytes()).decode("ascii")}
+    return packed
+
+
+def unpack(packed):
+    columns = {"classes": packed["classes"]}
+    for name in ("frame", "class_id", "confidence", "box"):
+        if name in packed:
+            spec = packed[name]
+            data = base64.b64decode(spec["data"])
+            columns[name] = np.frombuffer(data, dtype=spec["dtype"]).reshape(spec["shape"])
+    return columns
+
+
+# ----------------------------------------------------------
+# Encodings
+# ----------------------------------------------------------
+def encode(fmt, payload):
+    """Response body and media type for a payload holding packed columns."""
+    meta = {key: value for key, value in payload.items() if key != "columns"}
+    columns = unpack(payload["columns"])
+    if fmt == "json":
+        body = json.dumps({**meta, "columns": _json_columns(columns)}).encode()
+    elif fmt == "msgpack":
+        import msgpack
+        body = msgpack.packb({**meta, "columns": _binary_columns(columns)}, use_bin_type=True)
+    elif fmt == "arrow":
+        body = _arrow(columns, meta)
+    else:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+    return body, MEDIA_TYPES[fmt]
+
+
+def _json_columns(columns):
+    out = {"classes": columns["classes"], "count": int(len(columns["class_id"]))}
+    if "frame" in columns:
+        out["frame"] = columns["frame"].tolist()
+    out["class_id"] = columns["class_id"].tolist()
+    # Rounded in float64: a rounded float32 still prints as e.g. 0.8999999761581421
+    out["confidence"] = np.round(columns["confidence"].astype(np.float64), 4).tolist()
+    out["box"] = np.round(columns["box"].astype(np.float64), 1).ravel().tolist()   # flat x1, y1, x2, y2, x1, ...
+    return out
+
+
+def _binary_columns(columns):
+    # Raw little-endian buffers: np.frombuffer(data, dtype).reshape(shape) on the client
+    out = {"classes": columns["classes"], "count": int(len(columns["class_id"]))}
+    for name in _fields(columns):
+        array = np.ascontiguousarray(columns[name], dtype=DTYPES[name])
+        out[name] = {"dtype": DTYPES[name], "shape": list(array.shape), "data": array.tobytes()}
+    return out
+
+
+def _arrow(columns, meta):
+    import pyarrow as pa
+
+    box = columns["box"]
+    arrays = {}
+    if "frame" in columns:
+        arrays["frame"] = pa.array(columns["frame"], pa.int32())
+    arrays["class"] = pa.DictionaryArray.from_arrays(
+        pa.array(columns["class_id"], pa.int16()), pa.array(columns["classes"], pa.string())
+    )
+    arrays["confidence"] = pa.array(columns["confidence"], pa.float32())
+    for i, name in enumerate(("x1", "y1", "x2", "y2")):
+        arrays[name] = pa.array(np.ascontiguousarray(box[:, i]), pa.float32())
+
+    table = pa.table(arrays).replace_schema_metadata({"payload": json.dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,201 @@
+import os
+
+# ==========================================================
+# Runtime configuration
+# Every value can be overridden with an environment variable
+# of the same name, e.g. INFERENCE_WORKERS=4 uvicorn app:app
+# ==========================================================
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+def env_float(name, default):
+    return float(os.getenv(name, default))
+
+def env_str(name, default):
+    return os.getenv(name, default)
+
+
+# ==========================================================
+# Model
+# ==========================================================
+WEIGHT_PATH = env_str("WEIGHT_PATH", "weights/best(3).pt")
+CONFIDENCE = env_float("CONFIDENCE", 0.60)
+
+# Runtime for CPU inference; exported models are cached next to the weights
+MODEL_BACKEND = env_str("MODEL_BACKEND", "pytorch")          # pytorch | onnx | openvino
+MODEL_PRECISION = env_str("MODEL_PRECISION", "fp32")         # fp32 | fp16 | int8
+MODEL_THREADS = env_int("MODEL_THREADS", 0)                   # per worker, 0 = cores / workers
+MODEL_IMGSZ = env_int("MODEL_IMGSZ", 640)
+MODEL_INT8_DATA = env_str("MODEL_INT8_DATA", "")              # calibration yaml for OpenVINO int8
+WARMUP_RUNS = env_int("WARMUP_RUNS", 2)
+
+# ==========================================================
+# Inference worker pool
+# ==========================================================
+INFERENCE_MODE = env_str("INFERENCE_MODE", "thread")          # thread | process
+INFERENCE_WORKERS = env_int("INFERENCE_WORKERS", 2)
+INFERENCE_QUEUE_SIZE = env_int("INFERENCE_QUEUE_SIZE", 8)     # waiting requests on top of running ones
+INFERENCE_TIMEOUT = env_float("INFERENCE_TIMEOUT", 120)       # seconds per request
+
+# ==========================================================
+# Micro-batching of /api/predict/ image requests
+# BATCH_MAX_SIZE=1 turns batching off
+# ==========================================================
+BATCH_MAX_SIZE = env_int("BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = env_float("BATCH_MAX_WAIT_MS", 10)
+
+# ==========================================================
+# In-memory image path
+# IMAGE_MODE=memory decodes uploads without touching the disk;
+# SAVE_ARTIFACTS=1 still writes the upload + annotated copy
+# ==========================================================
+IMAGE_MODE = env_str("IMAGE_MODE", "disk")                    # disk | memory
+SAVE_ARTIFACTS = env_int("SAVE_ARTIFACTS", 0)
+
+# ==========================================================
+# Streaming video inference
+# ==========================================================
+VIDEO_CHUNK_SIZE = env_int("VIDEO_CHUNK_SIZE", 16)            # frames decoded per chunk
+
+# Frame sampling: all | stride | fps | motion
+VIDEO_SAMPLING = env_str("VIDEO_SAMPLING", "all")
+VIDEO_SAMPLE_STRIDE = env_int("VIDEO_SAMPLE_STRIDE", 5)
+VIDEO_SAMPLE_FPS = env_float("VIDEO_SAMPLE_FPS", 5)
+VIDEO_MOTION_THRESHOLD = env_float("VIDEO_MOTION_THRESHOLD", 4.0)  # mean abs pixel diff, 0-255
+VIDEO_MOTION_MAX_SKIP = env_int("VIDEO_MOTION_MAX_SKIP", 60)       # analyse at least every N frames
+
+# Annotated MP4 output (written once, during inference)
+VIDEO_ENCODER_PRESET = env_str("VIDEO_ENCODER_PRESET", "veryfast")   # libx264 preset
+VIDEO_ENCODER_CRF = env_int("VIDEO_ENCODER_CRF", 23)
+VIDEO_OUTPUT_FPS = env_float("VIDEO_OUTPUT_FPS", 0)           # 0 = keep source fps
+VIDEO_OUTPUT_MAX_WIDTH = env_int("VIDEO_OUTPUT_MAX_WIDTH", 0) # 0 = keep source size
+
+# ==========================================================
+# Live WebSocket detection
+# ==========================================================
+LIVE_ALLOW_STREAMS = env_int("LIVE_ALLOW_STREAMS", 0)         # allow {"source": "rtsp://..."}
+# Cameras the server may connect to: "host" or "host:port", comma separated
+LIVE_STREAM_HOSTS = {h.strip().lower() for h in env_str("LIVE_STREAM_HOSTS", "").split(",") if h.strip()}
+
+# ==========================================================
+# Prediction result cache (keyed on SHA-256 of the upload)
+# CACHE_MAX_ENTRIES=0 turns it off; CACHE_DIR enables the disk tier
+# ==========================================================
+CACHE_MAX_ENTRIES = env_int("CACHE_MAX_ENTRIES", 1024)
+CACHE_MAX_MB = env_int("CACHE_MAX_MB", 64)
+CACHE_DIR = env_str("CACHE_DIR", "")
+CACHE_DISK_MAX_MB = env_int("CACHE_DISK_MAX_MB", 512)
+
+# ==========================================================
+# SQLite storage (pooled connections, WAL mode)
+# ==========================================================
+AUTH_DB_FILE = env_str("AUTH_DB_FILE", "users.db")
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 4)                     # connections per database file
+DB_BUSY_TIMEOUT_MS = env_int("DB_BUSY_TIMEOUT_MS", 5000)
+AUTH_WORKERS = env_int("AUTH_WORKERS", 2)                     # threads serving auth DB calls
+
+# ==========================================================
+# Session tokens (HMAC-SHA256 signed, verified in process)
+# Set AUTH_SECRET in production; without it a random secret is
+# generated at startup and tokens die with the process.
+# ==========================================================
+AUTH_SECRET = env_str("AUTH_SECRET", "")
+AUTH_TOKEN_TTL = env_int("AUTH_TOKEN_TTL", 12 * 3600)         # seconds
+AUTH_REQUIRED = env_int("AUTH_REQUIRED", 1)                   # 0 = predict endpoints are open
+AUTH_REVOCATION_TTL = env_float("AUTH_REVOCATION_TTL", 30)    # seconds a revocation lookup is cached
+AUTH_REVOCATION_CACHE_SIZE = env_int("AUTH_REVOCATION_CACHE_SIZE", 10000)
+
+# ==========================================================
+# Password hashing (scrypt), on its own bounded thread pool
+# PASSWORD_HASH_COST is log2(N): 14 = 16 MB per hash; +1 doubles time and memory
+# ==========================================================
+PASSWORD_HASH_COST = env_int("PASSWORD_HASH_COST", 14)
+PASSWORD_HASH_R = env_int("PASSWORD_HASH_R", 8)
+PASSWORD_HASH_P = env_int("PASSWORD_HASH_P", 1)
+PASSWORD_HASH_WORKERS = env_int("PASSWORD_HASH_WORKERS", 2)
+PASSWORD_HASH_QUEUE_SIZE = env_int("PASSWORD_HASH_QUEUE_SIZE", 32)   # then 429
+
+# ==========================================================
+# Detection history (history.db, written in background batches)
+# ==========================================================
+HISTORY_ENABLED = env_int("HISTORY_ENABLED", 1)
+HISTORY_DB_FILE = env_str("HISTORY_DB_FILE", "history.db")
+HISTORY_BATCH_SIZE = env_int("HISTORY_BATCH_SIZE", 256)       # records per transaction
+HISTORY_FLUSH_MS = env_int("HISTORY_FLUSH_MS", 500)           # max delay before a write
+HISTORY_QUEUE_SIZE = env_int("HISTORY_QUEUE_SIZE", 10000)     # then records are dropped
+
+# Classes counted as PPE violations (lower-case, comma separated)
+VIOLATION_CLASSES = {c.strip().lower() for c in env_str("VIOLATION_CLASSES", "").split(",") if c.strip()}
+VIOLATION_PREFIXES = tuple(p.lower() for p in env_str("VIOLATION_PREFIXES", "no-,no_,no ").split(",") if p)
+
+# ==========================================================
+# Background jobs (jobs.db, POST /api/jobs + GET /api/jobs/{id})
+# ==========================================================
+JOBS_DB_FILE = env_str("JOBS_DB_FILE", "jobs.db")
+JOBS_CONCURRENCY = env_int("JOBS_CONCURRENCY", 2)             # jobs analysed at once
+JOBS_MAX_QUEUED = env_int("JOBS_MAX_QUEUED", 1000)            # then 429
+JOBS_MAX_ATTEMPTS = env_int("JOBS_MAX_ATTEMPTS", 3)           # restarts a job may survive
+JOBS_RETENTION_HOURS = env_float("JOBS_RETENTION_HOURS", 72)  # finished jobs kept this long
+JOBS_BUSY_BACKOFF_MS = env_int("JOBS_BUSY_BACKOFF_MS", 500)   # wait after a 429 from the pool
+
+# ==========================================================
+# Resumable chunked uploads (/api/uploads)
+# ==========================================================
+UPLOAD_PARTIAL_DIR = env_str("UPLOAD_PARTIAL_DIR", "static/uploads/partial")
+UPLOAD_CHUNK_SIZE = env_int("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)          # suggested to clients
+UPLOAD_MAX_CHUNK_BYTES = env_int("UPLOAD_MAX_CHUNK_BYTES", 64 * 1024 * 1024)
+UPLOAD_MAX_BYTES = env_int("UPLOAD_MAX_BYTES", 20 * 1024 ** 3)
+UPLOAD_SESSION_TTL_HOURS = env_float("UPLOAD_SESSION_TTL_HOURS", 24)     # idle sessions are dropped
+# Start a sampled analysis of a video once this much of it has arrived
+# (streamable containers only: MP4 with the index first, MKV, TS); 0 = off
+UPLOAD_PREVIEW_BYTES = env_int("UPLOAD_PREVIEW_BYTES", 32 * 1024 * 1024)
+UPLOAD_PREVIEW_SAMPLING = env_str("UPLOAD_PREVIEW_SAMPLING", "fps")
+
+# ==========================================================
+# Artifact storage (content-addressed, evicted in the background)
+# ==========================================================
+STORAGE_DB_FILE = env_str("STORAGE_DB_FILE", "storage.db")
+STORAGE_TTL_HOURS = env_float("STORAGE_TTL_HOURS", 7 * 24)        # unused this long -> deleted; 0 = keep
+STORAGE_MAX_MB = env_int("STORAGE_MAX_MB", 10 * 1024)             # LRU eviction above this; 0 = no quota
+STORAGE_SWEEP_SECONDS = env_float("STORAGE_SWEEP_SECONDS", 300)
+STORAGE_GRACE_SECONDS = env_float("STORAGE_GRACE_SECONDS", 600)   # recently used files are never evicted
+# Old scratch directories swept by age (whole subdirectories go)
+STORAGE_LEGACY_DIRS = tuple(d.strip() for d in env_str("STORAGE_LEGACY_DIRS", "temp_runs").split(",") if d.strip())
+
+# ==========================================================
+# Model registry (several weight files, hot-swapped without downtime)
+# MODELS="fast=weights/yolo12n.pt,accurate=weights/best(3).pt";
+# empty = a single model named DEFAULT_MODEL loaded from WEIGHT_PATH
+# ==========================================================
+MODELS = env_str("MODELS", "")
+DEFAULT_MODEL = env_str("DEFAULT_MODEL", "default")
+MODEL_DRAIN_TIMEOUT = env_float("MODEL_DRAIN_TIMEOUT", 300)    # seconds an old version may keep serving
+MODEL_WATCH_SECONDS = env_float("MODEL_WATCH_SECONDS", 0)      # reload when a weight file changes; 0 = off
+ADMIN_TOKEN = env_str("ADMIN_TOKEN", "")                       # X-Admin-Token for /api/models; empty = disabled
+
+# ==========================================================
+# Tiled inference for high-resolution still images
+# Images whose long side is at least TILE_MIN_SIDE are cut into
+# overlapping TILE_SIZE tiles so small objects keep their pixels
+# ==========================================================
+TILE_INFERENCE = env_int("TILE_INFERENCE", 0)
+TILE_SIZE = env_int("TILE_SIZE", 640)
+TILE_OVERLAP = env_float("TILE_OVERLAP", 0.2)                 # fraction of a tile shared with its neighbour
+TILE_MIN_SIDE = env_int("TILE_MIN_SIDE", 1280)
+TILE_FULL_FRAME = env_int("TILE_FULL_FRAME", 1)               # also run the whole image, for large objects
+TILE_NMS_METRIC = env_str("TILE_NMS_METRIC", "ios")           # iou | ios (intersection over smaller box)
+TILE_NMS_THRESHOLD = env_float("TILE_NMS_THRESHOLD", 0.6)
+
+# ==========================================================
+# Object tracking in videos (IoU / ByteTrack-style, CPU only)
+# Video results are summarised per tracked object, not per box
+# ==========================================================
+VIDEO_TRACKING = env_int("VIDEO_TRACKING", 1)
+TRACK_IOU = env_float("TRACK_IOU", 0.3)                       # min IoU to continue a track
+# Boxes between CONFIDENCE and TRACK_HIGH_CONFIDENCE only extend existing tracks
+TRACK_HIGH_CONFIDENCE = env_float("TRACK_HIGH_CONFIDENCE", min(CONFIDENCE + 0.15, 0.95))
+TRACK_MAX_AGE_SECONDS = env_float("TRACK_MAX_AGE_SECONDS", 1.0)         # how long a lost track can be found again
+TRACK_MIN_HITS = env_int("TRACK_MIN_HITS", 3)                 # shorter tracks are treated as noise
+TRACK_SEGMENT_MIN_FRAMES = env_int("TRACK_SEGMENT_MIN_FRAMES", 3)       # PPE change must hold this long
+TRACK_PERSON_CLASSES = {c.strip().lower() for c in env_str("TRACK_PERSON_CLASSES", "person,worker").split(",") if c.strip()}
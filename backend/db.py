@@ -0,0 +1,121 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import config
+
+# ==========================================================
+# Pooled SQLite connections
+# Connections are opened once, tuned once and then reused, so a query
+# costs a query instead of connect + pragmas + schema check.
+# ==========================================================
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # readers never block the writer
+    "PRAGMA synchronous=NORMAL",      # safe with WAL, one fsync per checkpoint
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",        # 8 MB page cache per connection
+    "PRAGMA mmap_size=67108864",      # 64 MB memory-mapped reads
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class ConnectionPool:
+    """A fixed-size pool of SQLite connections to one database file.
+
+    ``migrations`` is a list of SQL scripts; the ones newer than the
+    file's ``user_version`` are applied once when the pool is created.
+    """
+
+    def __init__(self, path, size=None, migrations=()):
+        self.path = path
+        self.size = size or config.DB_POOL_SIZE
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+        conn = self._connect()
+        self._created = 1
+        try:
+            self._migrate(conn, migrations)
+        finally:
+            self._idle.put(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,     # handed between worker threads, never shared at once
+            isolation_level=None,        # explicit transactions via transaction()
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @staticmethod
+    def _migrate(conn, migrations):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(migrations, start=1):
+            if number <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in filter(str.strip, script.split(";")):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={number}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._created < self.size
+            if can_open:
+                self._created += 1
+        if not can_open:
+            return self._idle.get(timeout=config.DB_BUSY_TIMEOUT_MS / 1000)
+        try:
+            return self._connect()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection (autocommit mode) for the ``with`` block."""
+        if self._closed:
+            raise RuntimeError(f"Connection pool for {self.path} is closed.")
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection inside one write transaction."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
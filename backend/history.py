@@ -0,0 +1,339 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+import auth
+import config
+import metrics
+from db import ConnectionPool
+from violations import is_violation
+
+# ==========================================================
+# Detection history
+# Every prediction is appended to history.db by a background writer:
+#   predictions   one row per analysed upload / video
+#   detections    one row per detected object, or per class with its
+#                 count when only class counts are known (videos)
+#   hourly_counts rollup (hour, source, class) -> count
+#   hourly_predictions rollup (hour, source) -> predictions, violations
+# The rollups are maintained in the same transaction as the raw rows,
+# so dashboard queries never scan the raw tables.
+# ==========================================================
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS predictions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        source TEXT NOT NULL,
+        filename TEXT,
+        user_id INTEGER,
+        total INTEGER NOT NULL,
+        violations INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_predictions_ts ON predictions (ts);
+    CREATE INDEX IF NOT EXISTS idx_predictions_source_ts ON predictions (source, ts);
+    CREATE INDEX IF NOT EXISTS idx_predictions_violations_ts ON predictions (ts) WHERE violations > 0;
+
+    CREATE TABLE IF NOT EXISTS detections (
+        prediction_id INTEGER NOT NULL REFERENCES predictions (id) ON DELETE CASCADE,
+        ts REAL NOT NULL,
+        class TEXT NOT NULL,
+        confidence REAL,                -- NULL when only class counts are known
+        violation INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_detections_prediction ON detections (prediction_id);
+    CREATE INDEX IF NOT EXISTS idx_detections_class_ts ON detections (class, ts);
+
+    CREATE TABLE IF NOT EXISTS hourly_counts (
+        hour INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        class TEXT NOT NULL,
+        violation INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hour, source, class)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_hourly_counts_class_hour ON hourly_counts (class, hour);
+
+    CREATE TABLE IF NOT EXISTS hourly_predictions (
+        hour INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        predictions INTEGER NOT NULL,
+        with_violations INTEGER NOT NULL,
+        PRIMARY KEY (hour, source)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    ALTER TABLE detections ADD COLUMN count INTEGER NOT NULL DEFAULT 1
+    ''',
+]
+
+
+# ==========================================================
+# Batched background writer
+# record() only appends to an in-memory queue; the writer drains it
+# every HISTORY_FLUSH_MS (or HISTORY_BATCH_SIZE records) and writes
+# the whole batch in one transaction on its own thread.
+# ==========================================================
+class HistoryWriter:
+    def __init__(self, path=None, batch_size=None, flush_ms=None, queue_size=None):
+        self.path = path or config.HISTORY_DB_FILE
+        self.batch_size = batch_size or config.HISTORY_BATCH_SIZE
+        self.flush_interval = (config.HISTORY_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self.pool = ConnectionPool(self.path, migrations=MIGRATIONS)
+
+        self._queue = asyncio.Queue(maxsize=queue_size or config.HISTORY_QUEUE_SIZE)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+        self._task = None
+        self._batch = []
+        self.dropped = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._drain())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Whatever is still queued (or was mid-collection) is written before shutdown
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    def record(self, source, filename, rows, user_id=None, ts=None):
+        """Queue one prediction given as ``(class, confidence_or_None, count)``
+        rows; never blocks, drops it if the queue is full."""
+        entry = (ts or time.time(), source, filename, user_id, rows)
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.HISTORY_DROPPED.inc()
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = [await self._queue.get()]
+            # Let a batch build up unless one is already waiting
+            if self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.flush_interval)
+            while len(self._batch) < self.batch_size and not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+
+            batch, self._batch = self._batch, []
+            try:
+                await loop.run_in_executor(self._executor, self._write, batch)
+            except Exception as e:
+                print(f"⚠️  Could not write {len(batch)} history records: {e}")
+
+    def _write(self, batch):
+        rollup = Counter()
+        per_hour = {}   # (hour, source) -> [predictions, with_violations]
+        with metrics.DB_SECONDS.time(op="history_write"), self.pool.transaction() as conn:
+            for ts, source, filename, user_id, rows in batch:
+                flags = [is_violation(name) for name, _, _ in rows]
+                cursor = conn.execute(
+                    "INSERT INTO predictions (ts, source, filename, user_id, total, violations) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (ts, source, filename, user_id, sum(count for _, _, count in rows),
+                     sum(count for (_, _, count), flag in zip(rows, flags) if flag))
+                )
+                prediction_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO detections (prediction_id, ts, class, confidence, violation, count) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(prediction_id, ts, name, conf, flag, count) for (name, conf, count), flag in zip(rows, flags)]
+                )
+                hour = int(ts // 3600) * 3600
+                counts = per_hour.setdefault((hour, source), [0, 0])
+                counts[0] += 1
+                counts[1] += any(flags)
+                for (name, _, count), flag in zip(rows, flags):
+                    rollup[(hour, source, name, flag)] += count
+
+            conn.executemany(
+                "INSERT INTO hourly_counts (hour, source, class, violation, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (hour, source, class) DO UPDATE SET count = count + excluded.count",
+                [(hour, source, name, int(flag), count) for (hour, source, name, flag), count in rollup.items()]
+            )
+            conn.executemany(
+                "INSERT INTO hourly_predictions (hour, source, predictions, with_violations) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (hour, source) DO UPDATE SET predictions = predictions + excluded.predictions, "
+                "with_violations = with_violations + excluded.with_violations",
+                [(hour, source, predictions, with_violations)
+                 for (hour, source), (predictions, with_violations) in per_hour.items()]
+            )
+
+    # ------------------------------------------------------
+    # Queries (run on the default executor, read-only)
+    # ------------------------------------------------------
+    def hourly(self, start, end, class_name=None, source=None, violations_only=False):
+        sql = ["SELECT hour, class, SUM(count), MAX(violation) FROM hourly_counts WHERE hour >= ? AND hour < ?"]
+        args = [int(start // 3600) * 3600, end]
+        if class_name:
+            sql.append("AND class = ?")
+            args.append(class_name)
+        if source:
+            sql.append("AND source = ?")
+            args.append(source)
+        if violations_only:
+            sql.append("AND violation = 1")
+        sql.append("GROUP BY hour, class ORDER BY hour, class")
+        with self.pool.connection() as conn:
+            rows = conn.execute(" ".join(sql), args).fetchall()
+        return [{"hour": hour, "class": name, "count": count, "violation": bool(flag)}
+                for hour, name, count, flag in rows]
+
+    def summary(self, start, end, source=None):
+        sql = ["SELECT class, SUM(count), MAX(violation) FROM hourly_counts WHERE hour >= ? AND hour < ?"]
+        args = [int(start // 3600) * 3600, end]
+        if source:
+            sql.append("AND source = ?")
+            args.append(source)
+        sql.append("GROUP BY class ORDER BY SUM(count) DESC")
+
+        count_sql = ("SELECT SUM(predictions), SUM(with_violations) FROM hourly_predictions "
+                     "WHERE hour >= ? AND hour < ?")
+        count_args = list(args[:2])
+        if source:
+            count_sql += " AND source = ?"
+            count_args.append(source)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(" ".join(sql), args).fetchall()
+            predictions, with_violations = conn.execute(count_sql, count_args).fetchone()
+        classes = {name: count for name, count, _ in rows}
+        return {
+            "start": start,
+            "end": end,
+            "predictions": predictions or 0,
+            "predictions_with_violations": with_violations or 0,
+            "classes": classes,
+            "violations": sum(count for _, count, flag in rows if flag),
+        }
+
+    def recent(self, limit=20, violations_only=False, before=None):
+        sql = ["SELECT id, ts, source, filename, total, violations FROM predictions"]
+        where, args = [], []
+        if violations_only:
+            where.append("violations > 0")
+        if before:
+            where.append("ts < ?")
+            args.append(before)
+        if where:
+            sql.append("WHERE " + " AND ".join(where))
+        sql.append("ORDER BY ts DESC LIMIT ?")
+        args.append(limit)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(" ".join(sql), args).fetchall()
+            ids = [row[0] for row in rows]
+            counts = {}
+            if ids:
+                marks = ",".join("?" * len(ids))
+                for prediction_id, name, count in conn.execute(
+                    f"SELECT prediction_id, class, SUM(count) FROM detections "
+                    f"WHERE prediction_id IN ({marks}) GROUP BY prediction_id, class", ids
+                ):
+                    counts.setdefault(prediction_id, {})[name] = count
+        return [
+            {"id": pid, "ts": ts, "source": source, "filename": filename,
+             "total": total, "violations": violations, "summary": counts.get(pid, {})}
+            for pid, ts, source, filename, total, violations in rows
+        ]
+
+
+writer = None
+
+
+def startup():
+    global writer
+    if config.HISTORY_ENABLED:
+        writer = HistoryWriter()
+        writer.start()
+
+
+async def shutdown():
+    global writer
+    if writer is not None:
+        await writer.stop()
+        writer = None
+
+
+def record(source, filename, detections, user=None):
+    if writer is not None:
+        writer.record(source, filename, [(d["class"], d.get("confidence"), 1) for d in detections],
+                      user["sub"] if user else None)
+
+
+def record_summary(source, filename, summary, user=None):
+    """Same as record() when only per-class counts are available; stored
+    as one row per class, not one per object."""
+    if writer is not None:
+        writer.record(source, filename, [(name, None, int(count)) for name, count in summary.items() if count],
+                      user["sub"] if user else None)
+
+
+# ==========================================================
+# Dashboard / notification queries
+# Time ranges are unix seconds; the default is the last 24 hours.
+# ==========================================================
+router = APIRouter(prefix="/api/history", tags=["history"])
+
+
+def time_range(start, end):
+    end = end or time.time()
+    return (start if start is not None else end - 24 * 3600), end
+
+
+def query_writer():
+    if writer is None:
+        raise HTTPException(status_code=503, detail="Detection history is disabled.")
+    return writer
+
+
+@router.get("/hourly")
+async def hourly_counts(
+    start: float | None = Query(None),
+    end: float | None = Query(None),
+    class_name: str | None = Query(None, alias="class"),
+    source: str | None = Query(None),
+    violations_only: bool = Query(False),
+    user: dict | None = Depends(auth.require_user),
+):
+    store = query_writer()
+    start, end = time_range(start, end)
+    return await asyncio.to_thread(store.hourly, start, end, class_name, source, violations_only)
+
+
+@router.get("/summary")
+async def summary(
+    start: float | None = Query(None),
+    end: float | None = Query(None),
+    source: str | None = Query(None),
+    user: dict | None = Depends(auth.require_user),
+):
+    store = query_writer()
+    start, end = time_range(start, end)
+    return await asyncio.to_thread(store.summary, start, end, source)
+
+
+@router.get("/recent")
+async def recent(
+    limit: int = Query(20, ge=1, le=500),
+    violations_only: bool = Query(True),
+    before: float | None = Query(None),
+    user: dict | None = Depends(auth.require_user),
+):
+    store = query_writer()
+    return await asyncio.to_thread(store.recent, limit, violations_only, before)
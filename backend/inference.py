@@ -0,0 +1,425 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+import metrics
+import tiling
+
+# ==========================================================
+# Errors surfaced to the API layer
+# ==========================================================
+class PoolBusy(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class InferenceTimeout(Exception):
+    """Raised when a request waited longer than its timeout."""
+
+
+class PoolClosed(PoolBusy):
+    """Raised when the pool was shut down, e.g. its model version was
+    swapped out while work on it was still running. Like PoolBusy it is
+    worth retrying, but on the version that is active now."""
+
+
+class UnreadableImage(ValueError):
+    """Raised when an uploaded image cannot be decoded."""
+
+
+# ==========================================================
+# Worker side: one YOLO instance per worker thread / process
+# ==========================================================
+_local = threading.local()
+
+def _init_worker(weight_path, backend, threads):
+    # YOLOv12 custom layers live in the yolov12 submodule
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "yolov12"))
+
+    import numpy as np
+    import torch
+    from ultralytics import YOLO
+
+    import backends
+
+    # Split the cores between workers instead of letting every
+    # worker spin up one thread per core
+    torch.set_num_threads(threads)
+    model = YOLO(weight_path, task="detect")
+
+    # Warm-up: the first predict builds the predictor / runtime session
+    dummy = np.zeros((config.MODEL_IMGSZ, config.MODEL_IMGSZ, 3), np.uint8)
+    model.predict(dummy, imgsz=config.MODEL_IMGSZ, verbose=False)
+    if backend != "pytorch" and backends.set_runtime_threads(model, weight_path, backend, threads):
+        model.predict(dummy, imgsz=config.MODEL_IMGSZ, verbose=False)
+    for _ in range(config.WARMUP_RUNS - 1):
+        model.predict(dummy, imgsz=config.MODEL_IMGSZ, verbose=False)
+
+    _local.model = model
+
+
+def get_model():
+    return _local.model
+
+
+def record(stage, seconds):
+    """Add time spent in ``stage`` to the current call's timings."""
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def record_speed(results):
+    # Ultralytics reports preprocess / inference / postprocess in ms
+    for r in results:
+        for stage, ms in (r.speed or {}).items():
+            if ms is not None:
+                record(stage, ms / 1000)
+
+
+def _timed_call(fn, *args):
+    """Run ``fn`` on the worker and return its result together with the
+    per-stage timings it recorded, when it started and how long it took.
+    The timings travel back with the result so process workers work too.
+    """
+    _local.timings = {}
+    started = time.time()
+    begin = time.perf_counter()
+    try:
+        result = fn(*args)
+    finally:
+        duration = time.perf_counter() - begin
+        timings, _local.timings = _local.timings, None
+    return result, timings, started, duration
+
+
+def ping():
+    return True
+
+
+def result_detections(r, names, with_boxes=False):
+    if not with_boxes:
+        return [
+            {"class": names[int(box.cls)], "confidence": float(box.conf)}
+            for box in r.boxes
+        ]
+    return [
+        {
+            "class": names[int(c)],
+            "confidence": round(float(p), 4),
+            "box": [round(v, 1) for v in xyxy]
+        }
+        for c, p, xyxy in zip(r.boxes.cls.tolist(), r.boxes.conf.tolist(), r.boxes.xyxy.tolist())
+    ]
+
+
+def result_columns(r, names):
+    """Detections as NumPy columns (see columnar.py), read straight from
+    the r.boxes tensors without building a Python object per box."""
+    import numpy as np
+
+    boxes = r.boxes
+    return {
+        "classes": [names[i] for i in range(len(names))],
+        "class_id": boxes.cls.cpu().numpy().astype(np.int16),
+        "confidence": boxes.conf.cpu().numpy().astype(np.float32),
+        "box": boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4),
+    }
+
+
+def save_annotated(result, path):
+    """Plot the boxes and write the image to ``path`` (atomically)."""
+    import cv2
+
+    begin = time.perf_counter()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    root, ext = os.path.splitext(path)
+    scratch = f"{root}.{os.getpid()}-{threading.get_ident()}{ext}"
+    cv2.imwrite(scratch, result.plot())
+    os.replace(scratch, path)
+    record("annotate", time.perf_counter() - begin)
+
+
+def _read_images(paths):
+    images = _decode_files(paths)
+    for image in images:
+        if isinstance(image, Exception):
+            raise image
+    return images
+
+
+def _decode_files(paths):
+    """Decoded BGR image per path, or an UnreadableImage in its place."""
+    import cv2
+
+    begin = time.perf_counter()
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        images.append(image if image is not None else UnreadableImage("Could not decode image."))
+    record("decode", time.perf_counter() - begin)
+    return images
+
+
+def predict_file(source, conf, annotated_path=None, columns=False):
+    """Run YOLO on a file on disk and return the detections list.
+
+    The annotated image is written to ``annotated_path`` when given.
+    With ``columns`` the detections come back as NumPy columns.
+    """
+    model = get_model()
+    if tiling.enabled():
+        results = tiling.predict(model, _read_images([source]), conf)
+    else:
+        results = model.predict(source=source, conf=conf, verbose=False)
+    record_speed(results)
+
+    detections = []
+    for r in results:
+        if annotated_path:
+            save_annotated(r, annotated_path)
+        if columns:
+            return result_columns(r, model.names)
+        detections.extend(result_detections(r, model.names))
+    return detections
+
+
+def predict_batch(items, conf):
+    """Run one batched forward pass over several images.
+
+    ``items`` are ``(source, annotated_path_or_None)`` pairs. Returns
+    one detections list per item, in the same order, or an
+    UnreadableImage for an item that could not be decoded, so one bad
+    upload does not fail the others in its batch.
+    """
+    model = get_model()
+    images = _decode_files([source for source, _ in items])
+    decoded = [image for image in images if not isinstance(image, Exception)]
+    if not decoded:
+        predicted = []
+    elif tiling.enabled():
+        predicted = tiling.predict(model, decoded, conf)
+    else:
+        predicted = model.predict(source=decoded, batch=len(decoded), conf=conf, verbose=False)
+    record_speed(predicted)
+    results = iter(predicted)
+
+    out = []
+    for image, (_, annotated_path) in zip(images, items):
+        if isinstance(image, Exception):
+            out.append(image)
+            continue
+        r = next(results)
+        if annotated_path:
+            save_annotated(r, annotated_path)
+        out.append(result_detections(r, model.names))
+    return out
+
+
+def predict_frames(frames, conf, annotate=False, columns=False):
+    """Run one batched pass over a chunk of decoded video frames.
+
+    Returns ``(detections, annotated_frame_or_None)`` per frame; with
+    ``columns`` the detections are NumPy columns instead of dicts.
+    """
+    model = get_model()
+    results = model.predict(source=frames, conf=conf, verbose=False)
+    record_speed(results)
+
+    out = []
+    for r in results:
+        plotted = None
+        if annotate:
+            begin = time.perf_counter()
+            plotted = r.plot()
+            record("annotate", time.perf_counter() - begin)
+        if columns:
+            out.append((result_columns(r, model.names), plotted))
+        else:
+            out.append((result_detections(r, model.names, with_boxes=True), plotted))
+    return out
+
+
+def encode_jpeg(image, quality=90):
+    import cv2
+
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ok else None
+
+
+def predict_images(payloads, conf, columns=False):
+    """In-memory variant of predict_batch.
+
+    ``payloads`` are raw encoded image bytes straight from the upload.
+    They are decoded here, never touch the disk, and the annotated
+    image comes back JPEG-encoded. Returns one dict per payload with
+    either ``detections`` (NumPy columns with ``columns``) +
+    ``annotated`` or an ``error``.
+    """
+    import cv2
+    import numpy as np
+
+    model = get_model()
+    begin = time.perf_counter()
+    images = [cv2.imdecode(np.frombuffer(p, np.uint8), cv2.IMREAD_COLOR) for p in payloads]
+    record("decode", time.perf_counter() - begin)
+    decoded = [img for img in images if img is not None]
+
+    if not decoded:
+        predicted = []
+    elif tiling.enabled():
+        predicted = tiling.predict(model, decoded, conf)
+    else:
+        predicted = model.predict(source=decoded, conf=conf, verbose=False)
+    record_speed(predicted)
+    results = iter(predicted)
+
+    out = []
+    for img in images:
+        if img is None:
+            out.append({"error": "Could not decode image."})
+            continue
+        r = next(results)
+        begin = time.perf_counter()
+        annotated = encode_jpeg(r.plot())
+        record("annotate", time.perf_counter() - begin)
+        out.append({
+            "detections": result_columns(r, model.names) if columns else result_detections(r, model.names),
+            "annotated": annotated
+        })
+    return out
+
+
+# ==========================================================
+# API side: bounded pool with backpressure and timeouts
+# ==========================================================
+class InferencePool:
+    def __init__(self, weight_path, workers=None, mode=None, queue_size=None, timeout=None, backend=None):
+        self.weight_path = weight_path
+        self.backend = backend or config.MODEL_BACKEND
+        self.workers = workers or config.INFERENCE_WORKERS
+        self.mode = mode or config.INFERENCE_MODE
+        self.max_pending = self.workers + (config.INFERENCE_QUEUE_SIZE if queue_size is None else queue_size)
+        self.timeout = timeout or config.INFERENCE_TIMEOUT
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def start(self):
+        threads = config.MODEL_THREADS or max(1, (os.cpu_count() or 1) // self.workers)
+        initargs = (self.weight_path, self.backend, threads)
+
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=initargs,
+            )
+        elif self.mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+                initializer=_init_worker,
+                initargs=initargs,
+            )
+        else:
+            raise ValueError(f"Unknown INFERENCE_MODE: {self.mode}")
+
+    async def warm_up(self):
+        """Wait until every worker has loaded and warmed up its model."""
+        futures = [self._executor.submit(ping) for _ in range(self.workers)]
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+    @property
+    def pending(self):
+        """Requests currently queued or running."""
+        return self._pending
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, timeout=None):
+        """Run ``fn(*args)`` on a worker and await its result.
+
+        Raises PoolBusy when the queue is full and InferenceTimeout when
+        the result does not arrive within ``timeout`` seconds.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolBusy("Inference queue is full, try again shortly.")
+            self._pending += 1
+
+        submitted = time.time()
+        try:
+            executor = self._executor
+            if executor is None:
+                raise PoolClosed("Model was reloaded, try again.")
+            try:
+                future = executor.submit(_timed_call, fn, *args)
+            except RuntimeError:
+                # Shut down between the check and the submit
+                raise PoolClosed("Model was reloaded, try again.")
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the work really finishes, so a timed-out
+        # request still counts against the queue until its worker is free
+        future.add_done_callback(self._release)
+
+        try:
+            result, timings, started, duration = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            future.cancel()  # only succeeds if it never left the queue
+            raise InferenceTimeout("Inference timed out.")
+
+        metrics.QUEUE_WAIT_SECONDS.observe(max(0.0, started - submitted))
+        metrics.WORKER_CALL_SECONDS.observe(duration, fn=fn.__name__)
+        for stage, seconds in timings.items():
+            metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+        return result
+
+
+def predict_live(frame, conf, annotate=False):
+    """Single frame for the live WebSocket feed.
+
+    ``frame`` is either encoded JPEG bytes from the browser or an
+    already decoded array from a stream reader.
+    """
+    import cv2
+    import numpy as np
+
+    if isinstance(frame, (bytes, bytearray)):
+        begin = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+        record("decode", time.perf_counter() - begin)
+        if frame is None:
+            return {"error": "Could not decode frame."}
+
+    model = get_model()
+    r = model.predict(source=frame, conf=conf, verbose=False)[0]
+    record_speed([r])
+
+    annotated = None
+    if annotate:
+        begin = time.perf_counter()
+        annotated = encode_jpeg(r.plot(), quality=80)
+        record("annotate", time.perf_counter() - begin)
+    return {
+        "detections": result_detections(r, model.names, with_boxes=True),
+        "annotated": annotated
+    }
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import time
+import uuid
+
+import config
+from db import ConnectionPool
+from inference import PoolBusy
+
+# ==========================================================
+# Background job queue (jobs.db)
+# Submitting only inserts a row; JOBS_CONCURRENCY worker tasks claim
+# queued jobs by priority (images before videos), oldest first. Jobs
+# that were running when the process stopped are picked up again on
+# the next start.
+# ==========================================================
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        filename TEXT,
+        upload_path TEXT NOT NULL,
+        digest TEXT,
+        user_id INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        result TEXT,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, created_at);
+    CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)
+    ''',
+    # Model registry: which registered model analyses the job (NULL = default)
+    "ALTER TABLE jobs ADD COLUMN model TEXT",
+]
+
+PRIORITY = {"image": 0, "video": 10}    # lower runs first
+
+COLUMNS = ("id", "kind", "priority", "status", "filename", "upload_path", "digest", "user_id",
+           "attempts", "created_at", "started_at", "finished_at", "result", "error", "model")
+
+
+class QueueFull(Exception):
+    """Raised when JOBS_MAX_QUEUED jobs are already waiting."""
+
+
+def _row(values):
+    job = dict(zip(COLUMNS, values))
+    if job["result"]:
+        job["result"] = json.loads(job["result"])
+    return job
+
+
+class JobQueue:
+    """``handler(job, progress)`` is an async callable returning the job's
+    result dict; it reports progress with ``progress(done, total)``."""
+
+    def __init__(self, handler, path=None, concurrency=None):
+        self.handler = handler
+        self.concurrency = concurrency or config.JOBS_CONCURRENCY
+        self.pool = ConnectionPool(path or config.JOBS_DB_FILE, migrations=MIGRATIONS)
+        self._wakeup = asyncio.Event()
+        self._workers = []
+        self._live = {}     # job id -> {"done", "total", "started"} for running jobs
+
+    # ------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------
+    async def start(self):
+        await asyncio.to_thread(self._recover)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Interrupted jobs go back to the queue without using up an attempt
+        interrupted = list(self._live)
+        self._live.clear()
+        if interrupted:
+            await asyncio.to_thread(self._requeue, interrupted, True)
+        self.pool.close()
+
+    def _recover(self):
+        retention = time.time() - config.JOBS_RETENTION_HOURS * 3600
+        with self.pool.transaction() as conn:
+            # Left 'running' by a crash; the attempt it used stays counted
+            conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (retention,))
+
+    # ------------------------------------------------------
+    # Submitting / reading
+    # ------------------------------------------------------
+    async def submit(self, kind, upload_path, filename=None, digest=None, user_id=None, model=None):
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._insert, job_id, kind, upload_path, filename, digest, user_id, model)
+        self._wakeup.set()
+        return job_id
+
+    def _insert(self, job_id, kind, upload_path, filename, digest, user_id, model):
+        with self.pool.transaction() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= config.JOBS_MAX_QUEUED:
+                raise QueueFull("Too many jobs waiting, try again later.")
+            conn.execute(
+                "INSERT INTO jobs (id, kind, priority, status, filename, upload_path, digest, user_id, created_at, model) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, PRIORITY.get(kind, 5), filename, upload_path, digest, user_id, time.time(), model)
+            )
+
+    def get(self, job_id):
+        """Job status for GET /api/jobs/{id}, or None if unknown."""
+        with self.pool.connection() as conn:
+            values = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if values is None:
+                return None
+            job = _row(values)
+            if job["status"] == "queued":
+                job["position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                    "(priority < ? OR (priority = ? AND created_at < ?))",
+                    (job["priority"], job["priority"], job["created_at"])
+                ).fetchone()[0]
+
+        live = self._live.get(job_id)
+        if live is not None and job["status"] == "running":
+            done, total = live["done"], live["total"]
+            elapsed = time.time() - live["started"]
+            job["progress"] = {
+                "done": done,
+                "total": total,
+                "percent": round(100 * done / total, 1) if total else None,
+                "eta_seconds": round(elapsed * (total - done) / done, 1) if total and done else None,
+            }
+        elif job["status"] == "done":
+            job["progress"] = {"percent": 100.0, "eta_seconds": 0}
+        return job
+
+    def active_paths(self):
+        """Uploads that queued or running jobs still have to read."""
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT upload_path FROM jobs WHERE status IN ('queued', 'running')"
+            )]
+
+    # ------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------
+    def _claim(self):
+        with self.pool.transaction() as conn:
+            while True:
+                values = conn.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority, created_at LIMIT 1"
+                ).fetchone()
+                if values is None:
+                    return None
+                job = _row(values)
+                if job["attempts"] >= config.JOBS_MAX_ATTEMPTS:
+                    # Crashed the worker every time it ran; do not retry forever
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                        (time.time(), "Job was interrupted too many times.", job["id"])
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (time.time(), job["id"])
+                )
+                return job
+
+    def _finish(self, job_id, result=None, error=None):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                ("failed" if error else "done", time.time(),
+                 None if result is None else json.dumps(result), error, job_id)
+            )
+
+    def _requeue(self, job_ids, refund_attempt):
+        with self.pool.transaction() as conn:
+            for job_id in job_ids:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', started_at = NULL, attempts = attempts - ? "
+                    "WHERE id = ? AND status = 'running'",
+                    (1 if refund_attempt else 0, job_id)
+                )
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                await self._wakeup.wait()
+                continue
+            await self._run(job)
+
+    async def _run(self, job):
+        state = self._live[job["id"]] = {"done": 0, "total": None, "started": time.time()}
+
+        def progress(done, total):
+            state["done"], state["total"] = done, total
+
+        try:
+            result = await self.handler(job, progress)
+        except PoolBusy:
+            # Interactive requests have the model, or its version was swapped
+            # out mid-job (PoolClosed); try again shortly on the active version
+            self._live.pop(job["id"], None)
+            await asyncio.to_thread(self._requeue, [job["id"]], True)
+            await asyncio.sleep(config.JOBS_BUSY_BACKOFF_MS / 1000)
+            self._wakeup.set()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._live.pop(job["id"], None)
+            await asyncio.to_thread(self._finish, job["id"], None, str(e) or type(e).__name__)
+            return
+        self._live.pop(job["id"], None)
+        await asyncio.to_thread(self._finish, job["id"], result)
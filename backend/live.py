@@ -0,0 +1,199 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import cv2
+from fastapi import WebSocket, WebSocketDisconnect
+
+import config
+import inference
+from inference import PoolBusy, PoolClosed, InferenceTimeout
+
+# ==========================================================
+# Latest-frame-wins slot
+# A new frame replaces one that has not been picked up yet, so a slow
+# model always works on the freshest frame instead of a growing backlog.
+# ==========================================================
+class LatestFrame:
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self.received += 1
+        self._event.set()
+
+    async def take(self):
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+# ==========================================================
+# RTSP / network stream reader (runs in its own thread)
+# ==========================================================
+def stream_allowed(url):
+    """Only rtsp(s):// cameras on LIVE_STREAM_HOSTS, so clients cannot make
+    the server connect to arbitrary hosts."""
+    if not config.LIVE_ALLOW_STREAMS:
+        return False
+    try:
+        parts = urlsplit(url)
+        host, port = (parts.hostname or "").lower(), parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ("rtsp", "rtsps") or not host:
+        return False
+    return host in config.LIVE_STREAM_HOSTS or f"{host}:{port}" in config.LIVE_STREAM_HOSTS
+
+
+class StreamReader:
+    """``on_end(reader)`` is called on the event loop when the stream
+    fails or ends by itself (not after stop())."""
+
+    def __init__(self, url, slot, loop, on_end=None):
+        self.url = url
+        self.slot = slot
+        self.loop = loop
+        self.on_end = on_end
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="live-reader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.url)
+        try:
+            if not cap.isOpened():
+                self.error = f"Could not open stream: {self.url}"
+                return
+            while not self._stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    self.error = "Stream ended."
+                    break
+                self.loop.call_soon_threadsafe(self.slot.put, frame)
+        finally:
+            cap.release()
+            if self.on_end is not None and not self._stop.is_set():
+                self.loop.call_soon_threadsafe(self.on_end, self)
+
+
+# ==========================================================
+# One WebSocket session
+# Client -> server: binary JPEG frames, or text JSON
+#   {"source": "rtsp://..."} to pull frames from a stream,
+#   {"stop": true} to stop that stream.
+# When that stream fails or ends, the client gets {"error": ...} and
+# the session is closed.
+# Server -> client: one JSON message per analysed frame, followed by the
+# annotated JPEG as a binary message when ?annotate=true; a frame dropped
+# because the model is saturated gets {"received", "dropped"} only.
+# ==========================================================
+async def run_session(websocket: WebSocket, pool, annotate=False, renew=None):
+    """``renew()`` returns the pool to continue on when ``pool`` is shut
+    down by a model hot-swap; without it the session ends."""
+    loop = asyncio.get_running_loop()
+    slot = LatestFrame()
+    reader = None
+    stream_failed = loop.create_future()
+
+    def on_end(ended):
+        if ended is reader and not stream_failed.done():
+            stream_failed.set_result(ended.error)
+
+    async def receive():
+        nonlocal reader
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes") is not None:
+                slot.put(message["bytes"])
+                continue
+
+            try:
+                command = json.loads(message.get("text") or "{}")
+            except ValueError:
+                command = {}
+            if reader is not None and (command.get("stop") or command.get("source")):
+                reader.stop()
+                reader = None
+            url = command.get("source")
+            if url:
+                if not stream_allowed(url):
+                    await websocket.send_json({"error": "This stream source is not allowed."})
+                    continue
+                reader = StreamReader(url, slot, loop, on_end)
+                reader.start()
+
+    async def process():
+        nonlocal pool
+        seq = 0
+        while True:
+            frame = await slot.take()
+            started = time.perf_counter()
+            try:
+                result = await pool.run(inference.predict_live, frame, config.CONFIDENCE, annotate)
+            except (PoolBusy, InferenceTimeout) as e:
+                if isinstance(e, PoolClosed):
+                    # Model version swapped out mid-session: go on with the active one
+                    if renew is None:
+                        raise
+                    pool = renew()
+                # Model is saturated: drop this frame, the next one wins.
+                # The client still gets a reply, so a client that waits for
+                # one before sending its next frame keeps going.
+                slot.dropped += 1
+                await websocket.send_json({"received": slot.received, "dropped": slot.dropped})
+                continue
+
+            seq += 1
+            message = {
+                "frame": seq,
+                "received": slot.received,
+                "dropped": slot.dropped,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+            if "error" in result:
+                message["error"] = result["error"]
+            else:
+                message["detections"] = result["detections"]
+                message["summary"] = Counter(d["class"] for d in result["detections"])
+
+            await websocket.send_json(message)
+            if annotate and result.get("annotated"):
+                await websocket.send_bytes(result["annotated"])
+
+    async def watch():
+        # No more frames will come: tell the client instead of waiting forever
+        error = await stream_failed
+        await websocket.send_json({"error": error or "Stream ended."})
+        await websocket.close(code=1011)
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(process()), asyncio.create_task(watch())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if reader is not None:
+            reader.stop()
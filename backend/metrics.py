@@ -0,0 +1,169 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ==========================================================
+# Minimal Prometheus-style metrics
+# Recording is a lock + a couple of increments; all formatting
+# happens in render(), i.e. only when /metrics is scraped.
+# ==========================================================
+_REGISTRY = []
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+SIZE_BUCKETS = (10e3, 50e3, 100e3, 500e3, 1e6, 5e6, 10e6, 50e6, 100e6, 500e6, 1e9)
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{k}="{v}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = function    # evaluated at scrape time
+
+    def set_function(self, function):
+        self._function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self._function is not None:
+            try:
+                return self._header() + [f"{self.name} {self._function()}"]
+            except Exception:
+                return self._header()
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}    # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = self._header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================================
+# Metrics used across the app
+# ==========================================================
+UPLOAD_BYTES = Histogram("ppe_upload_bytes", "Size of uploaded images and videos.",
+                         ["kind"], buckets=SIZE_BUCKETS)
+UPLOAD_WRITE_SECONDS = Histogram("ppe_upload_write_seconds", "Time spent writing uploads to disk.")
+STAGE_SECONDS = Histogram("ppe_stage_seconds",
+                          "Per-stage inference time (decode, preprocess, inference, postprocess, annotate).",
+                          ["stage"])
+QUEUE_WAIT_SECONDS = Histogram("ppe_queue_wait_seconds", "Time a job waited for a free inference worker.")
+WORKER_CALL_SECONDS = Histogram("ppe_worker_call_seconds", "Time a worker spent on one call.", ["fn"])
+VIDEO_SECONDS = Histogram("ppe_video_seconds", "Video encoding / conversion time.", ["step"])
+DB_SECONDS = Histogram("ppe_db_seconds", "SQLite time per auth operation.", ["op"])
+PASSWORD_HASH_SECONDS = Histogram("ppe_password_hash_seconds", "Password hash / verify time, queueing included.",
+                                  ["op"])
+REQUEST_SECONDS = Histogram("ppe_request_seconds", "End-to-end request latency.", ["route"])
+
+STORAGE_EVICTIONS = Counter("ppe_storage_evictions_total", "Stored uploads / annotated files evicted.", ["reason"])
+HISTORY_DROPPED = Counter("ppe_history_dropped_total", "History records dropped because the writer queue was full.")
+
+QUEUE_DEPTH = Gauge("ppe_inference_queue_depth", "Inference jobs queued or running.")
+IN_FLIGHT = Gauge("ppe_http_in_flight_requests", "HTTP requests currently being handled.")
+STORAGE_BYTES = Gauge("ppe_storage_bytes", "Bytes of indexed uploads and annotated files.")
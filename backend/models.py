@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import ExitStack, contextmanager
+
+import backends
+import cache
+import config
+import inference
+import tiling
+from batching import MicroBatcher
+from inference import InferencePool
+
+# ==========================================================
+# Model registry
+# Several named weight files (e.g. a fast nano and an accurate large
+# model) each get their own worker pool. Loading a new version builds
+# and warms up a fresh pool in the background, then swaps it in with
+# one dict assignment; requests that already hold the old version
+# finish on it, and its pool is shut down once they are done.
+# ==========================================================
+class UnknownModel(Exception):
+    """Raised when a request names a model that is not registered."""
+
+
+def parse_models(spec):
+    """``"fast=weights/n.pt,accurate=weights/l.pt"`` -> {name: path}."""
+    models = {}
+    for item in spec.split(","):
+        name, sep, path = item.partition("=")
+        if sep and name.strip() and path.strip():
+            models[name.strip()] = path.strip()
+    return models
+
+
+class ModelVersion:
+    """One loaded weight file: its pool, batchers and in-flight leases."""
+
+    def __init__(self, name, weight_path):
+        self.name = name
+        self.weight_path = weight_path
+        self.fingerprint = None
+        self.tag = None
+        self.mtime = None
+        self.pool = None
+        self.batcher = None
+        self.memory_batcher = None
+        self.loaded_at = None
+        self._leases = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def load(self):
+        if not os.path.exists(self.weight_path):
+            raise FileNotFoundError(f"Model file not found: {self.weight_path}")
+        self.mtime = os.path.getmtime(self.weight_path)
+        digest = await asyncio.to_thread(cache.model_fingerprint, self.weight_path)
+        self.fingerprint = "-".join(filter(None, [digest, config.MODEL_BACKEND, config.MODEL_PRECISION,
+                                                  tiling.signature()]))
+        # Short id for file names (annotated outputs differ per model)
+        self.tag = hashlib.sha256(self.fingerprint.encode()).hexdigest()[:12]
+
+        # Export to ONNX / OpenVINO once if that backend is selected
+        runtime_path = await asyncio.to_thread(backends.prepare_weights, self.weight_path)
+
+        # Each worker loads (and warms up) its own YOLO instance
+        pool = InferencePool(runtime_path)
+        pool.start()
+        try:
+            await pool.warm_up()
+        except BaseException:
+            pool.shutdown(wait=False)
+            raise
+        self.pool = pool
+
+        if config.BATCH_MAX_SIZE > 1:
+            self.batcher = MicroBatcher(pool)
+            self.batcher.start()
+            self.memory_batcher = MicroBatcher(pool, fn=inference.predict_images)
+            self.memory_batcher.start()
+        self.loaded_at = time.time()
+
+    @contextmanager
+    def lease(self):
+        """Hold this version for the duration of a request."""
+        self._leases += 1
+        self._idle.clear()
+        try:
+            yield self
+        finally:
+            self._leases -= 1
+            if self._leases == 0:
+                self._idle.set()
+
+    @property
+    def in_flight(self):
+        return self._leases
+
+    async def unload(self, drain_timeout=None):
+        """Wait for in-flight requests (up to ``drain_timeout``), then free the pool."""
+        timeout = config.MODEL_DRAIN_TIMEOUT if drain_timeout is None else drain_timeout
+        if not self._idle.is_set():
+            idle = asyncio.ensure_future(self._idle.wait())
+            done, _ = await asyncio.wait({idle}, timeout=timeout)
+            if not done:
+                idle.cancel()
+                print(f"⚠️  Model {self.name} still had {self._leases} requests after {timeout}s; unloading anyway")
+        if self.batcher is not None:
+            await self.batcher.stop()
+            await self.memory_batcher.stop()
+        if self.pool is not None:
+            await asyncio.to_thread(self.pool.shutdown)
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "weights": self.weight_path,
+            "version": self.fingerprint,
+            "loaded_at": self.loaded_at,
+            "workers": self.pool.workers if self.pool else 0,
+            "mode": self.pool.mode if self.pool else None,
+            "queue": self.pool.pending if self.pool else 0,
+            "in_flight": self._leases,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, models=None, default=None):
+        self.specs = models or parse_models(config.MODELS) or {config.DEFAULT_MODEL: config.WEIGHT_PATH}
+        self.default = default or config.DEFAULT_MODEL
+        if self.default not in self.specs:
+            self.default = next(iter(self.specs))
+        self._active = {}       # name -> ModelVersion serving new requests
+        self._retiring = set()  # old versions draining in the background
+        self._loading = {}      # name -> asyncio.Lock, one load per name at a time
+        self._tasks = set()
+        self.errors = {}        # name -> why the last background load failed
+        self._failed_mtime = {}  # name -> weight file mtime that failed to load
+        self._watcher = None
+
+    # ------------------------------------------------------
+    # Lookup (per request)
+    # ------------------------------------------------------
+    def get(self, name=None):
+        model = self._active.get(name or self.default)
+        if model is None:
+            raise UnknownModel(f"Unknown model: {name}. Available: {', '.join(sorted(self._active))}")
+        return model
+
+    def lease(self, name=None):
+        """``with registry.lease(name) as model:`` pins the active version."""
+        return self.get(name).lease()
+
+    @contextmanager
+    def session(self, name=None):
+        """Lease for long-running work (NDJSON streams, live sessions).
+
+        Yields ``(version, renew)``. When the held version was swapped out
+        and its pool shut down after MODEL_DRAIN_TIMEOUT (PoolClosed),
+        ``renew()`` leases the version active now and returns its pool.
+        """
+        with ExitStack() as stack:
+            version = stack.enter_context(self.lease(name))
+            yield version, lambda: stack.enter_context(self.lease(name)).pool
+
+    @property
+    def pending(self):
+        return sum(model.pool.pending for model in self._active.values())
+
+    def describe(self):
+        return {
+            "default": self.default,
+            "models": [model.describe() for model in self._active.values()],
+            "loading": sorted(name for name, lock in self._loading.items() if lock.locked()),
+            "draining": [model.describe() for model in self._retiring],
+            "errors": self.errors,
+        }
+
+    # ------------------------------------------------------
+    # Loading / hot-swap
+    # ------------------------------------------------------
+    async def start(self):
+        await asyncio.gather(*(self.load(name, path) for name, path in self.specs.items()))
+        if config.MODEL_WATCH_SECONDS > 0:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def load(self, name, weight_path=None):
+        """Load ``weight_path`` (default: the current one) as ``name`` and
+        swap it in once warm. The old version drains in the background."""
+        lock = self._loading.setdefault(name, asyncio.Lock())
+        async with lock:
+            current = self._active.get(name)
+            weight_path = weight_path or (current.weight_path if current else self.specs.get(name))
+            if weight_path is None:
+                raise UnknownModel(f"No weights given for new model: {name}")
+
+            model = ModelVersion(name, weight_path)
+            await model.load()
+            # The swap itself: new requests get the new version from here on
+            self._active[name] = model
+            self.specs[name] = weight_path
+            print(f"🚀 Model {name} loaded from {weight_path} "
+                  f"({model.pool.workers} {model.pool.mode} workers, {config.MODEL_BACKEND} {config.MODEL_PRECISION})")
+
+        if current is not None:
+            self._retire(current)
+        return model
+
+    def load_in_background(self, name, weight_path=None):
+        async def run():
+            path = weight_path or self.specs.get(name)
+            try:
+                mtime = os.path.getmtime(path) if path else None
+            except OSError:
+                mtime = None
+            try:
+                await self.load(name, weight_path)
+                self.errors.pop(name, None)
+                self._failed_mtime.pop(name, None)
+            except Exception as e:
+                self.errors[name] = str(e)
+                self._failed_mtime[name] = mtime
+                print(f"⚠️  Could not load model {name}: {e}")
+
+        self._track(asyncio.create_task(run()))
+
+    def _track(self, task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def remove(self, name):
+        if name == self.default:
+            raise ValueError("The default model cannot be removed.")
+        model = self._active.pop(name, None)
+        if model is None:
+            raise UnknownModel(f"Unknown model: {name}")
+        self.specs.pop(name, None)
+        self._retire(model)
+
+    def _retire(self, model):
+        self._retiring.add(model)
+        task = asyncio.create_task(model.unload())
+        task.add_done_callback(lambda _: self._retiring.discard(model))
+        self._track(task)
+
+    async def _watch(self):
+        """Reload a model when its weight file is replaced on disk."""
+        while True:
+            await asyncio.sleep(config.MODEL_WATCH_SECONDS)
+            for name, model in list(self._active.items()):
+                try:
+                    mtime = os.path.getmtime(model.weight_path)
+                except FileNotFoundError:
+                    continue
+                # A file that failed to load is only retried once it changes again
+                changed = mtime not in (model.mtime, self._failed_mtime.get(name))
+                if changed and not self._loading.get(name, asyncio.Lock()).locked():
+                    self.load_in_background(name)
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        # Taken first: cancelling a drain drops its model from _retiring
+        models = list(self._active.values()) + list(self._retiring)
+        self._active.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*(model.unload(drain_timeout=0) for model in models))
@@ -0,0 +1,64 @@
+import base64
+import hashlib
+import hmac
+import secrets
+
+import config
+
+# ==========================================================
+# Password hashing (scrypt from the standard library)
+# Stored as: scrypt$<log2 N>$<r>$<p>$<salt>$<hash>
+# PASSWORD_HASH_COST is log2 of the scrypt work factor N: each +1
+# doubles both the time and the memory (128 * r * N bytes) per hash.
+# ==========================================================
+PREFIX = "scrypt"
+HASH_BYTES = 32
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password, salt, cost, r, p):
+    n = 1 << cost
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * r * n,     # 2x the requirement; OpenSSL's default cap is 32 MB
+        dklen=HASH_BYTES,
+    )
+
+
+def hash_password(password, cost=None):
+    cost = cost or config.PASSWORD_HASH_COST
+    r, p = config.PASSWORD_HASH_R, config.PASSWORD_HASH_P
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, cost, r, p)
+    return f"{PREFIX}${cost}${r}${p}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(PREFIX + "$")
+
+
+def verify_password(password, stored):
+    """Return ``(matches, needs_rehash)``.
+
+    Rows written before hashing existed hold the plaintext password;
+    they verify by direct comparison and always need a rehash. Hashes
+    made with other cost settings than the current ones do too.
+    """
+    if not stored:
+        return False, False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+
+    try:
+        _, cost, r, p, salt, digest = stored.split("$")
+        cost, r, p = int(cost), int(r), int(p)
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), cost, r, p)
+    except ValueError:
+        return False, False
+
+    outdated = (cost, r, p) != (config.PASSWORD_HASH_COST, config.PASSWORD_HASH_R, config.PASSWORD_HASH_P)
+    return hmac.compare_digest(actual, expected), outdated
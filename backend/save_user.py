@@ -1,62 +1,137 @@
 import sqlite3
+import threading
+import time
+
+import config
+import passwords
+from db import ConnectionPool
+
+DB_FILE = config.AUTH_DB_FILE
+
+# Applied once per database file, tracked with PRAGMA user_version
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        email TEXT UNIQUE,
+        password TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        jti TEXT PRIMARY KEY,
+        expires_at INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires ON revoked_tokens (expires_at)
+    ''',
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared connection pool for users.db, created (and migrated) on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_FILE, migrations=MIGRATIONS)
+    return _pool
 
-DB_FILE = 'users.db'
 
 def ensure_table():
-    """Ensure the users table exists with correct columns."""
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE,
-            password TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Ensure the users table exists with correct columns.
 
-def register_user(name, email, password):
+    Only does work the first time; call it at startup so the first
+    request does not pay for opening the pool.
     """
-    Register a new user.
+    get_pool()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def register_user(name, email, password_hash):
+    """
+    Register a new user. ``password_hash`` comes from passwords.hash_password.
     Returns (True, message) if success, (False, message) if failure.
     """
-    ensure_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            'INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
-            (name, email, password)
-        )
-        conn.commit()
+        with get_pool().connection() as conn:
+            conn.execute(
+                'INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
+                (name, email, password_hash)
+            )
         return True, "User registered successfully."
     except sqlite3.IntegrityError:
         return False, "Email already exists."
-    finally:
-        conn.close()
+
+
+def get_user(email):
+    """Return the user row as a dict (including the stored password), or None."""
+    with get_pool().connection() as conn:
+        user = conn.execute(
+            'SELECT id, name, email, password FROM users WHERE email = ?',
+            (email,)
+        ).fetchone()
+    if not user:
+        return None
+    user_id, name, email, password = user
+    return {"id": user_id, "name": name, "email": email, "password": password}
+
+
+def update_password(user_id, password_hash):
+    with get_pool().connection() as conn:
+        conn.execute('UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id))
+
+
+def authenticate(email, password):
+    """
+    Check login credentials, upgrading legacy / outdated password rows.
+    Returns (user, message); user is a dict with id/name/email, or None.
+
+    Runs the KDF inline; async callers go through auth.py, which moves
+    the hashing onto its own worker pool.
+    """
+    user = get_user(email)
+    if not user:
+        return None, "User does not exist. Please sign up first."
+
+    matches, needs_rehash = passwords.verify_password(password, user.pop("password"))
+    if not matches:
+        return None, "Incorrect password."
+    if needs_rehash:
+        update_password(user["id"], passwords.hash_password(password))
+    return user, "Login successful."
+
 
 def check_login(email, password):
     """
     Check login credentials.
     Returns (True, message) if login successful, (False, message) if failed.
     """
-    ensure_table()
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=10)
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT id, name, email, password FROM users WHERE email = ?',
-        (email,)
-    )
-    user = cursor.fetchone()
-    conn.close()
+    user, message = authenticate(email, password)
+    return user is not None, message
 
-    if not user:
-        return False, "User does not exist. Please sign up first."
-    
-    user_id, name, email, db_password = user
-    if db_password == password:
-        return True, "Login successful."
-    else:
-        return False, "Incorrect password."
+
+def revoke_token(jti, expires_at):
+    """Remember a logged-out token until it would have expired anyway."""
+    with get_pool().connection() as conn:
+        conn.execute('DELETE FROM revoked_tokens WHERE expires_at < ?', (int(time.time()),))
+        conn.execute(
+            'INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)',
+            (jti, int(expires_at))
+        )
+
+
+def is_token_revoked(jti):
+    with get_pool().connection() as conn:
+        row = conn.execute('SELECT 1 FROM revoked_tokens WHERE jti = ?', (jti,)).fetchone()
+    return row is not None
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import config
+import metrics
+from db import ConnectionPool
+
+# ==========================================================
+# Content-addressed artifact storage
+#   static/uploads/ab/cd/<sha256><ext>       original uploads
+#   static/detections/ab/cd/<sha256><ext>    annotated images / videos
+# Paths come from the upload's SHA-256, so equal uploads share a file,
+# names never collide and no directory grows past a few hundred
+# entries. storage.db indexes every file with its size and last use;
+# a background sweep evicts by age (STORAGE_TTL_HOURS), then least
+# recently used first down to STORAGE_MAX_MB.
+# ==========================================================
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS artifacts (
+        path TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_artifacts_digest ON artifacts (digest, kind);
+    CREATE INDEX IF NOT EXISTS idx_artifacts_accessed ON artifacts (accessed_at)
+    ''',
+]
+
+ROOTS = {"upload": "static/uploads", "annotated": "static/detections"}
+
+
+class Storage:
+    def __init__(self, path=None, roots=None):
+        self.roots = roots or ROOTS
+        self.tmp_dir = os.path.join(self.roots["upload"], "tmp")
+        for directory in (*self.roots.values(), self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.pool = ConnectionPool(path or config.STORAGE_DB_FILE, migrations=MIGRATIONS)
+
+        self.protected = lambda: ()     # paths still needed, e.g. by queued jobs
+        self.total_bytes = 0
+        self._touched = {}              # path -> last use, written by the next sweep
+        self._lock = threading.Lock()
+        self._task = None
+        self._sweep = None
+
+    # ------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------
+    def path_for(self, kind, digest, ext):
+        return "/".join([self.roots[kind], digest[:2], digest[2:4], digest + ext.lower()])
+
+    def temp_path(self, ext=""):
+        """Scratch file on the same filesystem, moved into place by adopt()."""
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex + ext).replace("\\", "/")
+
+    # ------------------------------------------------------
+    # Index
+    # ------------------------------------------------------
+    def adopt(self, src, kind, digest, ext):
+        """Move a finished file to its content address and index it."""
+        path = self.path_for(kind, digest, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src, path)
+        self.add(path, kind, digest)
+        return path
+
+    def add(self, path, kind, digest):
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO artifacts (path, kind, digest, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size = excluded.size, accessed_at = excluded.accessed_at",
+                (path, kind, digest, os.path.getsize(path), now, now)
+            )
+
+    def lookup(self, kind, digest):
+        """Path of the stored artifact for ``digest`` (one index probe), or None."""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT path FROM artifacts WHERE digest = ? AND kind = ? ORDER BY accessed_at DESC LIMIT 1",
+                (digest, kind)
+            ).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        self.touch(row[0])
+        return row[0]
+
+    def touch(self, *paths):
+        """Mark files as used; cheap, the index is updated by the next sweep."""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                if path:
+                    self._touched[path] = now
+
+    # ------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------
+    def sweep(self):
+        """One eviction pass; returns the number of files removed."""
+        now = time.time()
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        protected = set(self.protected())
+        # Files in use right now (a request still analysing them) are never evicted
+        grace = now - config.STORAGE_GRACE_SECONDS
+        removed = 0
+
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                "UPDATE artifacts SET accessed_at = MAX(accessed_at, ?) WHERE path = ?",
+                [(ts, path) for path, ts in touched.items()]
+            )
+
+        if config.STORAGE_TTL_HOURS > 0:
+            cutoff = min(grace, now - config.STORAGE_TTL_HOURS * 3600)
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    "SELECT path, size, accessed_at FROM artifacts WHERE accessed_at < ?", (cutoff,)
+                ).fetchall()
+            removed += self._evict(rows, protected, "ttl")
+
+        with self.pool.connection() as conn:
+            self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+        limit = config.STORAGE_MAX_MB * 1024 * 1024
+        if limit and self.total_bytes > limit:
+            # Evict down to 90% so the next upload does not trigger another pass
+            excess = self.total_bytes - int(limit * 0.9)
+            victims = []
+            with self.pool.connection() as conn:
+                for path, size, accessed_at in conn.execute(
+                    "SELECT path, size, accessed_at FROM artifacts WHERE accessed_at < ? ORDER BY accessed_at",
+                    (grace,)
+                ):
+                    if excess <= 0:
+                        break
+                    if path in protected:
+                        continue
+                    victims.append((path, size, accessed_at))
+                    excess -= size
+            removed += self._evict(victims, protected, "quota")
+
+        removed += self._sweep_loose(now)
+        return removed
+
+    def _evict(self, rows, protected, reason):
+        # A row is only deleted if nobody used or re-stored the file since it
+        # was selected (same accessed_at, not touched meanwhile); only files
+        # whose row went away are removed from disk
+        with self._lock:
+            touched = set(self._touched)
+        evicted = []
+        with self.pool.transaction() as conn:
+            for path, size, accessed_at in rows:
+                if path in protected or path in touched:
+                    continue
+                cursor = conn.execute("DELETE FROM artifacts WHERE path = ? AND accessed_at = ?", (path, accessed_at))
+                if cursor.rowcount:
+                    evicted.append((path, size))
+        for path, size in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️  Could not evict {path}: {e}")
+            metrics.STORAGE_EVICTIONS.inc(reason=reason)
+        self.total_bytes -= sum(size for _, size in evicted)
+        return len(evicted)
+
+    def _sweep_loose(self, now):
+        """Files outside the index: abandoned scratch files and old temp_runs."""
+        removed = 0
+        stale_tmp = now - max(config.STORAGE_GRACE_SECONDS, 3600)
+        for entry in _scandir(self.tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < stale_tmp:
+                removed += _remove(entry.path)
+
+        if config.STORAGE_TTL_HOURS <= 0:
+            return removed
+        cutoff = now - config.STORAGE_TTL_HOURS * 3600
+        for directory in config.STORAGE_LEGACY_DIRS:
+            for entry in _scandir(directory):
+                if entry.stat().st_mtime < cutoff:
+                    removed += _remove(entry.path)
+        return removed
+
+    # ------------------------------------------------------
+    # Background task
+    # ------------------------------------------------------
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # A sweep already on its thread is allowed to finish
+        if self._sweep is not None and not self._sweep.done():
+            await asyncio.wait({self._sweep})
+        self.pool.close()
+
+    async def _run(self):
+        while True:
+            self._sweep = asyncio.ensure_future(asyncio.to_thread(self.sweep))
+            try:
+                removed = await asyncio.shield(self._sweep)
+                if removed:
+                    print(f"🧹 Storage sweep removed {removed} files ({self.total_bytes / 1e6:.1f} MB kept)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Storage sweep failed: {e}")
+            await asyncio.sleep(config.STORAGE_SWEEP_SECONDS)
+
+
+def _scandir(directory):
+    try:
+        return list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+
+
+def _remove(path):
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        print(f"⚠️  Could not remove {path}: {e}")
+        return 0
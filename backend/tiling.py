@@ -0,0 +1,148 @@
+import time
+
+import numpy as np
+
+import config
+
+# ==========================================================
+# Tiled (sliced) inference for high-resolution images
+# A 4K frame shrunk to the model input makes a 30 px worker about
+# 5 px tall. Large images are instead cut into overlapping
+# TILE_SIZE tiles (plus, optionally, the whole frame for large
+# objects), all tiles of all images go through the model in one
+# batched call, and the boxes are shifted back and merged with
+# class-aware NMS.
+# ==========================================================
+def enabled():
+    return bool(config.TILE_INFERENCE)
+
+
+def signature():
+    """Part of the model fingerprint, so cached results follow the settings."""
+    if not enabled():
+        return ""
+    return (f"tiles{config.TILE_SIZE}o{config.TILE_OVERLAP}m{config.TILE_MIN_SIDE}"
+            f"f{config.TILE_FULL_FRAME}{config.TILE_NMS_METRIC}{config.TILE_NMS_THRESHOLD}")
+
+
+def needs_tiling(image):
+    return enabled() and max(image.shape[:2]) >= config.TILE_MIN_SIDE
+
+
+def windows(width, height, size, overlap):
+    """Top-left corners of ``size`` tiles covering the image, neighbours
+    sharing ``overlap`` pixels; the last row/column is shifted inwards."""
+    def starts(length):
+        if length <= size:
+            return [0]
+        step = max(1, size - overlap)
+        return list(range(0, length - size, step)) + [length - size]
+
+    return [(x, y) for y in starts(height) for x in starts(width)]
+
+
+def nms(boxes, scores, classes, threshold, metric="iou"):
+    """Class-aware greedy NMS; returns the indices to keep, best first.
+
+    ``metric="ios"`` compares intersection with the smaller box, which
+    also removes the partial box a tile sees of an object that the
+    full-frame pass (or a neighbouring tile) detected whole.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Shift each class into its own coordinate range so classes never overlap
+    offset = classes[:, None] * (boxes.max() + 1)
+    b = boxes + offset
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        w = np.clip(np.minimum(b[i, 2], b[rest, 2]) - np.maximum(b[i, 0], b[rest, 0]), 0, None)
+        h = np.clip(np.minimum(b[i, 3], b[rest, 3]) - np.maximum(b[i, 1], b[rest, 1]), 0, None)
+        inter = w * h
+        if metric == "ios":
+            denom = np.minimum(areas[i], areas[rest])
+        else:
+            denom = areas[i] + areas[rest] - inter
+        order = rest[inter / np.maximum(denom, 1e-9) <= threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _whole(data, origin, tile_shape, image_shape, overlap):
+    """Mask of tile boxes that are not cut off by an inner tile edge.
+
+    An object narrower than the overlap that is cut at one tile's edge
+    lies whole inside the neighbouring tile, so the cut copy is dropped.
+    Wider objects are kept; NMS (and the full-frame pass) sorts them out.
+    """
+    x, y = origin
+    th, tw = tile_shape[:2]
+    H, W = image_shape[:2]
+    x1, y1, x2, y2 = data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+    cut_x = ((x > 0) & (x1 <= 1)) | ((x + tw < W) & (x2 >= tw - 1))
+    cut_y = ((y > 0) & (y1 <= 1)) | ((y + th < H) & (y2 >= th - 1))
+    return ~((cut_x & (x2 - x1 < overlap)) | (cut_y & (y2 - y1 < overlap)))
+
+
+def predict(model, images, conf):
+    """``model.predict`` over decoded BGR images, tiling the large ones.
+
+    Returns one Ultralytics ``Results`` per image, so plotting and
+    result_detections() work unchanged.
+    """
+    size = config.TILE_SIZE
+    overlap = int(size * config.TILE_OVERLAP)
+    crops, owners = [], []      # owner: (image index, tile origin or None for the whole frame)
+    for i, image in enumerate(images):
+        tiled = needs_tiling(image)
+        if not tiled or config.TILE_FULL_FRAME:
+            crops.append(image)
+            owners.append((i, None))
+        if tiled:
+            h, w = image.shape[:2]
+            for x, y in windows(w, h, size, overlap):
+                crops.append(np.ascontiguousarray(image[y:y + size, x:x + size]))
+                owners.append((i, (x, y)))
+
+    results = model.predict(source=crops, batch=len(crops), conf=conf, verbose=False) if crops else []
+    parts = [[] for _ in images]
+    for r, (i, origin) in zip(results, owners):
+        parts[i].append((r, origin))
+
+    out = []
+    for image, image_parts in zip(images, parts):
+        if len(image_parts) == 1 and image_parts[0][1] is None:
+            out.append(image_parts[0][0])
+        else:
+            out.append(_merge(model, image, image_parts, conf, overlap))
+    return out
+
+
+def _merge(model, image, parts, conf, overlap):
+    import torch
+    from ultralytics.engine.results import Results
+
+    begin = time.perf_counter()
+    speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+    rows = []
+    for r, origin in parts:
+        for stage, ms in (r.speed or {}).items():
+            if ms is not None:
+                speed[stage] = speed.get(stage, 0.0) + ms
+        data = r.boxes.data.cpu().numpy()[:, :6].copy()
+        if origin is not None and len(data):
+            data = data[_whole(data, origin, r.orig_shape, image.shape, overlap)]
+            data[:, [0, 2]] += origin[0]
+            data[:, [1, 3]] += origin[1]
+        rows.append(data)
+
+    data = np.concatenate(rows) if rows else np.zeros((0, 6), np.float32)
+    data = data[data[:, 4] >= conf]
+    data = data[nms(data[:, :4], data[:, 4], data[:, 5], config.TILE_NMS_THRESHOLD, config.TILE_NMS_METRIC)]
+    speed["postprocess"] += (time.perf_counter() - begin) * 1000
+
+    merged = Results(image, path="", names=model.names, boxes=torch.from_numpy(np.ascontiguousarray(data)))
+    merged.speed = speed
+    return merged
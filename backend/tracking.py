@@ -0,0 +1,197 @@
+import numpy as np
+
+import config
+from violations import is_violation
+
+# ==========================================================
+# Multi-object tracking for videos (IoU / ByteTrack-style, CPU only)
+# Boxes of consecutive analysed frames are linked into tracks by IoU
+# with a constant-velocity guess of where each track moved. As in
+# ByteTrack, confident boxes are matched first and may start tracks;
+# weaker ones only keep existing tracks alive. PPE boxes inside a
+# person track are collected into that person's compliance timeline.
+# ==========================================================
+def iou_matrix(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), np.float32)
+    w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = w * h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def greedy_match(scores, threshold):
+    """Pairs (row, col) by descending score, each row and column used once."""
+    pairs = []
+    if scores.size == 0:
+        return pairs
+    scores = scores.copy()
+    while True:
+        row, col = np.unravel_index(np.argmax(scores), scores.shape)
+        if scores[row, col] < threshold:
+            return pairs
+        pairs.append((int(row), int(col)))
+        scores[row, :] = -1
+        scores[:, col] = -1
+
+
+def signature():
+    """Tracker settings as part of video cache keys ("" with tracking off)."""
+    if not config.VIDEO_TRACKING:
+        return ""
+    return (f"tracks{config.TRACK_IOU}h{config.TRACK_HIGH_CONFIDENCE}a{config.TRACK_MAX_AGE_SECONDS}"
+            f"m{config.TRACK_MIN_HITS}s{config.TRACK_SEGMENT_MIN_FRAMES}p{','.join(sorted(config.TRACK_PERSON_CLASSES))}")
+
+
+def is_person(class_name):
+    return class_name.lower() in config.TRACK_PERSON_CLASSES
+
+
+def _arrays(detections):
+    """``(classes, confidences, boxes)`` from detection dicts or NumPy columns."""
+    if isinstance(detections, dict):
+        names = detections["classes"]
+        return ([names[i] for i in detections["class_id"].tolist()],
+                np.asarray(detections["confidence"], np.float32),
+                np.asarray(detections["box"], np.float32).reshape(-1, 4))
+    return ([d["class"] for d in detections],
+            np.asarray([d["confidence"] for d in detections], np.float32),
+            np.asarray([d["box"] for d in detections], np.float32).reshape(-1, 4))
+
+
+def count_violations(tracks):
+    """Tracked objects in violation: people whose timeline shows a violation
+    when the model detects people, otherwise the violation-class tracks
+    themselves (e.g. one "NO-Hardhat" track per bare head)."""
+    people = [t for t in tracks if is_person(t["class"])]
+    return sum(1 for t in (people or tracks) if t["violation"])
+
+
+class Track:
+    def __init__(self, track_id, cls, confidence, box, frame):
+        self.id = track_id
+        self.cls = cls
+        self.box = box
+        self.velocity = np.zeros(4, np.float32)     # box change per frame
+        self.first_frame = self.last_frame = frame
+        self.hits = 1
+        self.confidence = float(confidence)
+        self.segments = []      # [start_frame, end_frame, frozenset of PPE classes]
+        self._pending = None    # [classes, start_frame, frames seen] waiting to become a segment
+
+    def predicted(self, frame):
+        return self.box + self.velocity * (frame - self.last_frame)
+
+    def update(self, confidence, box, frame):
+        gap = max(1, frame - self.last_frame)
+        self.velocity = 0.5 * self.velocity + 0.5 * (box - self.box) / gap
+        self.box = box
+        self.last_frame = frame
+        self.hits += 1
+        self.confidence = max(self.confidence, float(confidence))
+
+    def observe(self, frame, classes):
+        """Record the PPE classes seen on this person; a change only opens a
+        new timeline segment once it held for TRACK_SEGMENT_MIN_FRAMES frames."""
+        classes = frozenset(classes)
+        if self.segments and classes == self.segments[-1][2]:
+            self.segments[-1][1] = frame
+            self._pending = None
+            return
+        if not self.segments:
+            self.segments.append([frame, frame, classes])
+            return
+        if self._pending is not None and self._pending[0] == classes:
+            self._pending[2] += 1
+        else:
+            self._pending = [classes, frame, 1]
+        if self._pending[2] >= config.TRACK_SEGMENT_MIN_FRAMES:
+            self.segments.append([self._pending[1], frame, classes])
+            self._pending = None
+
+    def describe(self, fps):
+        timeline = [
+            {
+                "start": round(start / fps, 2),
+                "end": round(end / fps, 2),
+                "present": sorted(c for c in classes if not is_violation(c)),
+                "violations": sorted(c for c in classes if is_violation(c)),
+            }
+            for start, end, classes in self.segments
+        ]
+        track = {
+            "track_id": self.id,
+            "class": self.cls,
+            "first_seen": round(self.first_frame / fps, 2),
+            "last_seen": round(self.last_frame / fps, 2),
+            "frames": self.hits,
+            "confidence": round(self.confidence, 4),
+            "violation": is_violation(self.cls) or any(segment["violations"] for segment in timeline),
+        }
+        if is_person(self.cls):
+            track["timeline"] = timeline
+        return track
+
+
+class Tracker:
+    def __init__(self, fps):
+        self.fps = fps
+        self.max_age = max(1, round(config.TRACK_MAX_AGE_SECONDS * fps))
+        self._active = []
+        self._finished = []
+        self._next_id = 1
+
+    def update(self, frame, detections):
+        """Feed the detections (dicts with ``box``, or NumPy columns) of one analysed frame."""
+        alive = []
+        for track in self._active:
+            (alive if frame - track.last_frame <= self.max_age else self._finished).append(track)
+        self._active = alive
+
+        classes, confidences, boxes = _arrays(detections)
+        high = np.flatnonzero(confidences >= config.TRACK_HIGH_CONFIDENCE)
+        low = np.flatnonzero(confidences < config.TRACK_HIGH_CONFIDENCE)
+        matched, unmatched = self._associate(self._active, high, classes, confidences, boxes, frame)
+        # Second pass: weak boxes may only continue tracks, never start one
+        self._associate([t for t in self._active if t.id not in matched], low, classes, confidences, boxes, frame)
+
+        for i in unmatched:
+            self._active.append(Track(self._next_id, classes[i], confidences[i], boxes[i], frame))
+            self._next_id += 1
+
+        self._attribute_ppe(frame, classes, boxes)
+
+    def _associate(self, tracks, indices, classes, confidences, boxes, frame):
+        """Match the boxes at ``indices`` to tracks of the same class; returns
+        the ids of the matched tracks and the indices left over."""
+        if not tracks or not len(indices):
+            return set(), list(indices)
+        predicted = np.stack([t.predicted(frame) for t in tracks])
+        scores = iou_matrix(predicted, boxes[indices])
+        same_class = np.asarray([[t.cls == classes[i] for i in indices] for t in tracks])
+        scores[~same_class] = -1
+        matched, used = set(), set()
+        for row, col in greedy_match(scores, config.TRACK_IOU):
+            i = indices[col]
+            tracks[row].update(confidences[i], boxes[i], frame)
+            matched.add(tracks[row].id)
+            used.add(col)
+        return matched, [i for col, i in enumerate(indices) if col not in used]
+
+    def _attribute_ppe(self, frame, classes, boxes):
+        people = [t for t in self._active if t.last_frame == frame and is_person(t.cls)]
+        if not people:
+            return
+        gear = [i for i, name in enumerate(classes) if not is_person(name)]
+        centres = ((boxes[gear, :2] + boxes[gear, 2:]) / 2).reshape(-1, 2)
+        for person in people:
+            x1, y1, x2, y2 = person.box
+            inside = (centres[:, 0] >= x1) & (centres[:, 0] <= x2) & (centres[:, 1] >= y1) & (centres[:, 1] <= y2)
+            person.observe(frame, {classes[gear[i]] for i in np.flatnonzero(inside)})
+
+    def tracks(self):
+        """Timelines of every track confirmed by TRACK_MIN_HITS matches."""
+        return [t.describe(self.fps) for t in sorted(self._active + self._finished, key=lambda t: t.id)
+                if t.hits >= config.TRACK_MIN_HITS]
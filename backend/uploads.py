@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import config
+import metrics
+
+# ==========================================================
+# Resumable chunked uploads
+#   init     -> session id, the file is created as <id>.part
+#   chunk    -> bytes at an offset, checked against their SHA-256 and
+#               written straight into the .part file (no chunk files)
+#   finalize -> whole-file hash checked, .part moved into storage
+# The offset to resume from is the size of the .part file, so a
+# session survives a dropped connection and a server restart. Session
+# metadata sits next to it as <id>.json.
+# ==========================================================
+class UploadError(Exception):
+    """Raised for a request the session cannot accept; carries the HTTP status."""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class UploadSession:
+    FIELDS = ("id", "filename", "size", "content_type", "sha256", "user_id", "created_at")
+
+    def __init__(self, directory, id, filename, size, content_type=None, sha256=None,
+                 user_id=None, created_at=None):
+        self.id = id
+        self.filename = filename
+        self.size = size
+        self.content_type = content_type or "application/octet-stream"
+        self.sha256 = sha256.lower() if sha256 else None
+        self.user_id = user_id
+        self.created_at = created_at or time.time()
+        self.part_path = os.path.join(directory, f"{id}.part")
+        self.meta_path = os.path.join(directory, f"{id}.json")
+        self.lock = threading.Lock()      # one chunk write at a time
+        self.received = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+        self.updated_at = time.time()
+        # Whole-file hash, fed as chunks arrive in order; lost on restart,
+        # in which case finalize re-reads the file
+        self._digest = hashlib.sha256() if self.received == 0 else None
+        self.preview = None               # early analysis of the received prefix
+        self.finalized = None             # (final_path, digest) once moved into place
+
+    @property
+    def kind(self):
+        return "video" if self.content_type.startswith("video/") else "image"
+
+    @property
+    def complete(self):
+        return self.received == self.size
+
+    def status(self):
+        return {
+            "upload_id": self.id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.received,
+            "complete": self.complete,
+            "chunk_size": config.UPLOAD_CHUNK_SIZE,
+            "preview": self.preview,
+        }
+
+    def _save_meta(self):
+        with open(self.meta_path, "w") as f:
+            json.dump({field: getattr(self, field) for field in self.FIELDS}, f)
+
+    def write_chunk(self, offset, data, sha256=None):
+        """Append ``data`` at ``offset``; returns the new offset."""
+        if sha256 and hashlib.sha256(data).hexdigest() != sha256.strip().lower():
+            raise UploadError("Chunk checksum mismatch.", 422, self.received)
+        with self.lock:
+            if offset != self.received:
+                # Lost response or out-of-order chunk: tell the client where to resume
+                raise UploadError("Offset does not match the received size.", 409, self.received)
+            if offset + len(data) > self.size:
+                raise UploadError("Chunk runs past the declared size.", 413, self.received)
+            with metrics.UPLOAD_WRITE_SECONDS.time():
+                with open(self.part_path, "r+b") as f:
+                    f.seek(offset)
+                    f.write(data)
+                    f.truncate()
+            if self._digest is not None:
+                self._digest.update(data)
+            self.received += len(data)
+            self.updated_at = time.time()
+            return self.received
+
+    def finalize(self, place, sha256=None):
+        """Check the whole file and hand it to ``place(path, digest)``, which
+        moves it to its final location; returns ``(final_path, digest)``.
+
+        Calling it again returns the same result, so a finalize whose job
+        could not be queued can simply be retried."""
+        with self.lock:
+            if self.finalized is not None:
+                return self.finalized
+            if not self.complete:
+                raise UploadError("Upload is incomplete.", 409, self.received)
+            if self._digest is not None:
+                digest = self._digest.hexdigest()
+            else:
+                digest = hashlib.sha256()
+                with open(self.part_path, "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(block)
+                digest = digest.hexdigest()
+            expected = (sha256 or self.sha256 or "").lower()
+            if expected and digest != expected:
+                raise UploadError("File checksum mismatch.", 422, self.received)
+            path = place(self.part_path, digest)
+            _remove(self.meta_path)
+            self.finalized = path, digest
+        metrics.UPLOAD_BYTES.observe(self.size, kind=self.kind)
+        return path, digest
+
+    def discard(self):
+        with self.lock:
+            _remove(self.part_path)
+            _remove(self.meta_path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadStore:
+    """Open upload sessions, kept in memory and reloaded from disk on demand."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or config.UPLOAD_PARTIAL_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename, size, content_type=None, sha256=None, user_id=None):
+        filename = os.path.basename(filename or "")
+        if not filename:
+            raise UploadError("A filename is required.")
+        if size <= 0:
+            raise UploadError("Size must be positive.")
+        if size > config.UPLOAD_MAX_BYTES:
+            raise UploadError("File is too large.", 413)
+        self.purge_expired()
+        session = UploadSession(self.directory, uuid.uuid4().hex, filename, size, content_type, sha256, user_id)
+        open(session.part_path, "wb").close()
+        session._save_meta()
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is not None:
+                return session
+            # Started before a restart: pick it up from the sidecar file
+            meta_path = os.path.join(self.directory, f"{os.path.basename(upload_id)}.json")
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return None
+            session = self._sessions[upload_id] = UploadSession(self.directory, **meta)
+            return session
+
+    def forget(self, upload_id):
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+
+    def purge_expired(self):
+        """Drop sessions idle for longer than UPLOAD_SESSION_TTL_HOURS."""
+        cutoff = time.time() - config.UPLOAD_SESSION_TTL_HOURS * 3600
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-len(".json")]
+            meta_path = os.path.join(self.directory, name)
+            part_path = os.path.join(self.directory, f"{upload_id}.part")
+            try:
+                # Chunk writes touch the .part file, not the metadata
+                last = max(os.path.getmtime(meta_path),
+                           os.path.getmtime(part_path) if os.path.exists(part_path) else 0)
+            except FileNotFoundError:
+                continue
+            if last < cutoff:
+                _remove(part_path)
+                _remove(meta_path)
+                self.forget(upload_id)
@@ -0,0 +1,423 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import zlib
+from collections import Counter
+
+import cv2
+
+import columnar
+import config
+import inference
+import metrics
+from inference import PoolBusy, PoolClosed
+
+# ==========================================================
+# Frame decoding / writing helpers
+# ==========================================================
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {path}")
+        return {
+            "fps": cap.get(cv2.CAP_PROP_FPS) or 20,
+            "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        cap.release()
+
+
+def iter_frame_chunks(path, chunk_size, wanted=None):
+    """Yield ``(first_frame_index, [frames])`` without loading the whole video.
+
+    When ``wanted(index)`` is given, other frames are only grabbed, not
+    decoded, and show up as None in the chunk.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        index, chunk = 0, []
+        while True:
+            if wanted is None or wanted(index + len(chunk)):
+                ok, frame = cap.read()
+            else:
+                ok, frame = cap.grab(), None
+            if not ok:
+                break
+            chunk.append(frame)
+            if len(chunk) == chunk_size:
+                yield index, chunk
+                index += len(chunk)
+                chunk = []
+        if chunk:
+            yield index, chunk
+    finally:
+        cap.release()
+
+
+# ==========================================================
+# Frame sampling: which frames actually go through the model
+# ==========================================================
+class FrameSampler:
+    """Picks the frames to analyse.
+
+    all    - every frame
+    stride - every VIDEO_SAMPLE_STRIDE-th frame
+    fps    - about VIDEO_SAMPLE_FPS frames per second of video
+    motion - frames whose mean pixel difference from the last analysed
+             frame is at least VIDEO_MOTION_THRESHOLD (0-255 scale), and
+             at least one every VIDEO_MOTION_MAX_SKIP frames
+    """
+
+    def __init__(self, fps, strategy=None):
+        self.strategy = strategy or config.VIDEO_SAMPLING
+        if self.strategy == "stride":
+            self.stride = max(1, config.VIDEO_SAMPLE_STRIDE)
+        elif self.strategy == "fps":
+            self.stride = max(1, round(fps / config.VIDEO_SAMPLE_FPS))
+        elif self.strategy in ("all", "motion"):
+            self.stride = 1
+        else:
+            raise ValueError(f"Unknown sampling strategy: {self.strategy}")
+
+        self._last_small = None
+        self._last_index = None
+
+    @property
+    def needs_pixels(self):
+        return self.strategy == "motion"
+
+    def wanted(self, index):
+        return index % self.stride == 0
+
+    def select(self, index, frame):
+        if self.strategy != "motion":
+            return self.wanted(index)
+
+        h, w = frame.shape[:2]
+        small = cv2.cvtColor(cv2.resize(frame, (64, max(1, h * 64 // w))), cv2.COLOR_BGR2GRAY)
+        if (
+            self._last_small is None
+            or index - self._last_index >= config.VIDEO_MOTION_MAX_SKIP
+            or cv2.absdiff(small, self._last_small).mean() >= config.VIDEO_MOTION_THRESHOLD
+        ):
+            self._last_small, self._last_index = small, index
+            return True
+        return False
+
+
+def signature(strategy=None):
+    """Sampling settings as part of video cache keys, so cached results follow them."""
+    strategy = strategy or config.VIDEO_SAMPLING
+    if strategy == "stride":
+        return f"stride{config.VIDEO_SAMPLE_STRIDE}"
+    if strategy == "fps":
+        return f"fps{config.VIDEO_SAMPLE_FPS}"
+    if strategy == "motion":
+        return f"motion{config.VIDEO_MOTION_THRESHOLD}s{config.VIDEO_MOTION_MAX_SKIP}"
+    return strategy
+
+
+# ==========================================================
+# Drawing boxes (also used to carry boxes onto skipped frames)
+# ==========================================================
+_PALETTE = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+    (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+    (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255),
+]
+
+def iter_boxes(detections):
+    """``(class, confidence, box)`` from detection dicts or NumPy columns."""
+    if isinstance(detections, dict):
+        names = detections["classes"]
+        return zip((names[i] for i in detections["class_id"].tolist()),
+                   detections["confidence"].tolist(), detections["box"].tolist())
+    return ((d["class"], d["confidence"], d["box"]) for d in detections)
+
+
+def class_counts(detections):
+    if isinstance(detections, dict):
+        return columnar.class_counts(detections)
+    return Counter(d["class"] for d in detections)
+
+
+def draw_detections(frame, detections):
+    for name, confidence, box in iter_boxes(detections):
+        x1, y1, x2, y2 = (int(v) for v in box)
+        color = _PALETTE[zlib.crc32(name.encode()) % len(_PALETTE)]
+        label = f'{name} {confidence:.2f}'
+
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        top = max(y1, th + 4)
+        cv2.rectangle(frame, (x1, top - th - 4), (x1 + tw + 2, top), color, -1)
+        cv2.putText(frame, label, (x1 + 1, top - 3), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
+
+
+def write_annotated(writer, frames, per_frame_detections):
+    with metrics.VIDEO_SECONDS.time(step="draw"):
+        annotated = [draw_detections(f, d) for f, d in zip(frames, per_frame_detections)]
+    writer.write(annotated)
+
+
+def convert_avi_to_mp4(input_path: str) -> str:
+    if not input_path.lower().endswith(".avi"):
+        return input_path
+
+    from moviepy import VideoFileClip
+
+    output_path = input_path.replace(".avi", ".mp4")
+    with metrics.VIDEO_SECONDS.time(step="convert"), VideoFileClip(input_path) as clip:
+        clip.write_videofile(
+            output_path,
+            codec="libx264",
+            audio=False,
+            preset=config.VIDEO_ENCODER_PRESET,
+            fps=clip.fps or 20
+        )
+    os.remove(input_path)
+    return output_path
+
+
+def _ffmpeg_exe():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which("ffmpeg")
+
+
+class AnnotatedWriter:
+    """Writes annotated frames straight into a browser-playable MP4.
+
+    Frames are piped into ffmpeg/libx264 as they come out of the model,
+    so the video is encoded exactly once. Without ffmpeg it tries
+    OpenCV's H.264 writer, and only as a last resort writes an .avi
+    that moviepy re-encodes on close().
+
+    VIDEO_OUTPUT_FPS and VIDEO_OUTPUT_MAX_WIDTH optionally thin out
+    and downscale the output.
+    """
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.source_fps = fps
+        self._stride = 1
+        if config.VIDEO_OUTPUT_FPS and config.VIDEO_OUTPUT_FPS < fps:
+            self._stride = max(1, round(fps / config.VIDEO_OUTPUT_FPS))
+        self.fps = fps / self._stride
+
+        self._count = 0
+        self._size = None
+        self._proc = None
+        self._writer = None
+        self._avi_path = None
+
+    def _open(self, frame):
+        h, w = frame.shape[:2]
+        if config.VIDEO_OUTPUT_MAX_WIDTH and w > config.VIDEO_OUTPUT_MAX_WIDTH:
+            h = round(h * config.VIDEO_OUTPUT_MAX_WIDTH / w)
+            w = config.VIDEO_OUTPUT_MAX_WIDTH
+        # yuv420p needs even dimensions
+        self._size = (w - w % 2, h - h % 2)
+        w, h = self._size
+
+        ffmpeg = _ffmpeg_exe()
+        if ffmpeg:
+            self._proc = subprocess.Popen(
+                [
+                    ffmpeg, "-y", "-loglevel", "error",
+                    "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", f"{self.fps:.3f}",
+                    "-i", "-",
+                    "-an", "-c:v", "libx264",
+                    "-preset", config.VIDEO_ENCODER_PRESET,
+                    "-crf", str(config.VIDEO_ENCODER_CRF),
+                    "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                    self.path,
+                ],
+                stdin=subprocess.PIPE,
+            )
+            return
+
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"avc1"), self.fps, self._size)
+        if writer.isOpened():
+            self._writer = writer
+            return
+
+        self._avi_path = os.path.splitext(self.path)[0] + ".avi"
+        self._writer = cv2.VideoWriter(self._avi_path, cv2.VideoWriter_fourcc(*"XVID"), self.fps, self._size)
+
+    def write(self, frames):
+        with metrics.VIDEO_SECONDS.time(step="encode"):
+            self._write(frames)
+
+    def _write(self, frames):
+        for frame in frames:
+            self._count += 1
+            if (self._count - 1) % self._stride:
+                continue
+            if self._size is None:
+                self._open(frame)
+            if frame.shape[1::-1] != self._size:
+                frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+
+            if self._proc is not None:
+                self._proc.stdin.write(frame.tobytes())
+            else:
+                self._writer.write(frame)
+
+    def close(self):
+        """Finish the file and return its path (None if nothing was written)."""
+        if self._size is None:
+            return None
+        if self._proc is not None:
+            self._proc.stdin.close()
+            with metrics.VIDEO_SECONDS.time(step="finalize"):
+                returncode = self._proc.wait()
+            if returncode != 0:
+                raise RuntimeError("ffmpeg failed to encode the annotated video.")
+            self._proc = None
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+        if self._avi_path is not None:
+            self.path = convert_avi_to_mp4(self._avi_path)
+            self._avi_path = None
+        return self.path
+
+
+# ==========================================================
+# Streaming pipeline: decode chunk -> pool inference -> write
+# Only two chunks are ever held in memory, however long the video.
+# ==========================================================
+def _close_quietly(writer):
+    try:
+        writer.close()
+    except Exception:
+        pass
+
+
+async def _run_chunk(pool, frames, conf, annotate, columns=False):
+    while True:
+        try:
+            return await pool.run(inference.predict_frames, frames, conf, annotate, columns)
+        except PoolClosed:
+            raise
+        except PoolBusy:
+            # The stream is already accepted; wait for a free slot
+            await asyncio.sleep(0.05)
+
+
+async def stream_detections(pool, path, output_path=None, conf=None, chunk_size=None,
+                            granularity="frame", sampling=None, columns=False, renew=None):
+    """Async generator of per-frame (or per-second) detection events.
+
+    Only sampled frames go through the model and get an event; in the
+    annotated output the last boxes are carried onto skipped frames.
+    The last event has ``"done": True`` with the overall summary and
+    ``peak``, the most boxes of each class seen in one frame. With
+    ``columns`` each frame's detections are NumPy columns. ``renew()``
+    returns the pool to continue on when ``pool`` is shut down
+    mid-video (a model hot-swap); without it PoolClosed is raised.
+    """
+    conf = conf or config.CONFIDENCE
+    chunk_size = chunk_size or config.VIDEO_CHUNK_SIZE
+
+    info = await asyncio.to_thread(video_info, path)
+    fps = info["fps"]
+    sampler = FrameSampler(fps, sampling)
+    writer = AnnotatedWriter(output_path, fps) if output_path else None
+
+    # Skipped frames need no decoding unless we draw them or diff them
+    decode_all = writer is not None or sampler.needs_pixels
+    chunks = iter_frame_chunks(path, chunk_size, None if decode_all else sampler.wanted)
+
+    summary, peak = Counter(), Counter()
+    frames_total = frames_analysed = 0
+    carried = []
+    second, second_summary, second_peak, second_frames = 0, Counter(), Counter(), 0
+
+    prefetch = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+    try:
+        while True:
+            item = await prefetch
+            if item is None:
+                break
+            start, frames = item
+            # Decode the next chunk while this one is on the model
+            prefetch = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+
+            picked = [
+                i for i, frame in enumerate(frames)
+                if frame is not None and sampler.select(start + i, frame)
+            ]
+            results = []
+            if picked:
+                try:
+                    results = await _run_chunk(pool, [frames[i] for i in picked], conf, False, columns)
+                except PoolClosed:
+                    if renew is None:
+                        raise
+                    pool = renew()
+                    results = await _run_chunk(pool, [frames[i] for i in picked], conf, False, columns)
+            by_offset = {i: detections for i, (detections, _) in zip(picked, results)}
+
+            if writer is not None:
+                per_frame = []
+                for i in range(len(frames)):
+                    carried = by_offset.get(i, carried)
+                    per_frame.append(carried)
+                await asyncio.to_thread(write_annotated, writer, frames, per_frame)
+            frames_total += len(frames)
+            del frames
+
+            for offset in picked:
+                detections = by_offset[offset]
+                index = start + offset
+                frames_analysed += 1
+                classes = class_counts(detections)
+                summary.update(classes)
+                peak |= classes
+
+                if granularity == "second":
+                    current = int(index / fps)
+                    if current != second and second_frames:
+                        yield {"second": second, "frames": second_frames,
+                               "summary": second_summary, "peak": second_peak}
+                        second_summary, second_peak, second_frames = Counter(), Counter(), 0
+                    second = current
+                    second_frames += 1
+                    second_summary.update(classes)
+                    second_peak |= classes
+                else:
+                    yield {"frame": index, "time": round(index / fps, 3), "detections": detections}
+
+        if granularity == "second" and second_frames:
+            yield {"second": second, "frames": second_frames,
+                   "summary": second_summary, "peak": second_peak}
+
+        annotated_path = None
+        if writer is not None:
+            annotated_path = await asyncio.to_thread(writer.close)
+        yield {"done": True, "frames": frames_total, "analysed_frames": frames_analysed,
+               "sampling": sampler.strategy, "fps": fps, "summary": summary, "peak": peak,
+               "annotated_path": annotated_path}
+    finally:
+        # Never close the generator while a decode thread is inside it
+        if not prefetch.done():
+            try:
+                await prefetch
+            except Exception:
+                pass
+        chunks.close()
+        if writer is not None:
+            # Waiting for ffmpeg / the remux stays off the event loop; if this
+            # task is cancelled meanwhile, the thread still finishes on its own
+            await asyncio.to_thread(_close_quietly, writer)
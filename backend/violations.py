@@ -0,0 +1,12 @@
+import config
+
+# ==========================================================
+# Which detected classes count as PPE violations
+# Shared by the history rollups and the video tracker; kept free of
+# the database and web imports so either can use it.
+# ==========================================================
+def is_violation(class_name):
+    name = class_name.lower()
+    if name in config.VIOLATION_CLASSES:
+        return True
+    return any(name.startswith(prefix) for prefix in config.VIOLATION_PREFIXES)
@@ -1,5 +1,6 @@
 // src/App.jsx
 import React, { useState } from 'react';
+import { API_BASE } from './config';
 
 // Components
 import Header from './components/Header';
@@ -33,6 +34,13 @@ const App = () => {
   };
 
   const handleLogout = () => {
+    // Revoke the session token server-side; the UI logs out regardless
+    if (user?.token) {
+      fetch(`${API_BASE}/logout`, {
+        method: 'POST',
+        headers: { Authorization: `Bearer ${user.token}` },
+      }).catch(() => {});
+    }
     setUser(null);
     setIsLoggedIn(false);
     setCurrentPage('Login');
@@ -88,10 +96,10 @@ const App = () => {
     // Authenticated views
     switch (currentPage) {
       case 'Dashboard':
-        content = <DashboardView />;
+        content = <DashboardView token={user?.token} />;
         break;
       case 'Notifications':
-        content = <NotificationsView />;
+        content = <NotificationsView token={user?.token} />;
         break;
       case 'CheckPage':
         content = <CheckView checkType={checkType} />;
@@ -100,7 +108,7 @@ const App = () => {
         content = <AboutView onNavigate={handleNavigate} />;
         break;
       case 'PPE':
-        content = <PPEDetectionView />;
+        content = <PPEDetectionView token={user?.token} />;
         break;
       case 'Home':
       default:
@@ -3,3 +3,6 @@ const isLocalhost = window.location.hostname === "localhost" || window.location.
 export const API_BASE = isLocalhost
   ? "http://127.0.0.1:8000/api"   // Local backend
   : "http://teimsafety.com/api";  // Live backend
+
+// WebSocket endpoints live under the same API base
+export const WS_BASE = API_BASE.replace(/^http/, "ws");
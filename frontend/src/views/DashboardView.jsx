@@ -1,11 +1,39 @@
 // src/views/DashboardView.jsx
 
-import React from 'react';
+import React, { useEffect, useState } from 'react';
+import { API_BASE } from '../config';
+
+const PIE_COLORS = ['rgb(30, 64, 175)', 'rgb(59, 130, 246)', 'rgb(147, 197, 253)'];
+const PIE_TEXT = ['text-blue-900', 'text-blue-600', 'text-blue-300'];
 
 /**
  * Dashboard View (Design a2.jpg)
+ * Figures come from the detection history (/api/history), last 24 hours.
  */
-const DashboardView = () => {
+const DashboardView = ({ token }) => {
+  const [summary, setSummary] = useState(null);
+  const [hourly, setHourly] = useState([]);
+  const [error, setError] = useState('');
+
+  useEffect(() => {
+    const headers = token ? { Authorization: `Bearer ${token}` } : {};
+    const load = async () => {
+      try {
+        const [summaryRes, hourlyRes] = await Promise.all([
+          fetch(`${API_BASE}/history/summary`, { headers }),
+          fetch(`${API_BASE}/history/hourly?violations_only=true`, { headers }),
+        ]);
+        if (!summaryRes.ok || !hourlyRes.ok) throw new Error('history unavailable');
+        setSummary(await summaryRes.json());
+        setHourly(await hourlyRes.json());
+      } catch (err) {
+        console.error('Dashboard error:', err);
+        setError('Could not load statistics.');
+      }
+    };
+    load();
+  }, [token]);
+
   const StatCircle = ({ percent, title, color }) => (
     <div className="flex flex-col items-center p-4">
       <div className={`relative w-28 h-28 flex items-center justify-center rounded-full border-4 ${color}`}>
@@ -15,55 +43,73 @@ const DashboardView = () => {
     </div>
   );
 
+  const checks = summary?.predictions || 0;
+  const flagged = summary?.predictions_with_violations || 0;
+  const compliance = checks ? `${Math.round((100 * (checks - flagged)) / checks)}%` : '–';
+  const detections = Object.values(summary?.classes || {}).reduce((a, b) => a + b, 0);
+
+  // Top three classes for the pie chart
+  const top = Object.entries(summary?.classes || {}).slice(0, 3);
+  const topTotal = top.reduce((sum, [, count]) => sum + count, 0) || 1;
+  let offset = 0;
+  const stops = top.map(([, count], i) => {
+    const start = offset;
+    offset += (100 * count) / topTotal;
+    return `${PIE_COLORS[i]} ${start}% ${offset}%`;
+  });
+
+  // Violations per hour, oldest first
+  const perHour = {};
+  hourly.forEach((row) => { perHour[row.hour] = (perHour[row.hour] || 0) + row.count; });
+  const hours = Object.keys(perHour).sort().slice(-24);
+  const peak = Math.max(1, ...hours.map((h) => perHour[h]));
+
   return (
     <div className="max-w-6xl mx-auto p-6">
       <h3 className="text-2xl font-semibold mb-6 text-gray-700 border-b pb-2">Statistic Graphs</h3>
+      {error && <p className="text-red-600 mb-4">{error}</p>}
 
       {/* Metric Circles */}
       <div className="grid grid-cols-2 md:grid-cols-4 gap-4 mb-10">
-        <StatCircle percent="70%" title="02" color="border-blue-500 text-blue-700" />
-        <StatCircle percent="50%" title="01" color="border-blue-500 text-blue-700" />
-        <StatCircle percent="80%" title="03" color="border-blue-500 text-blue-700" />
-        <StatCircle percent="100%" title="04" color="border-blue-500 text-blue-700" />
+        <StatCircle percent={checks} title="Checks (24h)" color="border-blue-500 text-blue-700" />
+        <StatCircle percent={compliance} title="Compliant" color="border-blue-500 text-blue-700" />
+        <StatCircle percent={summary?.violations || 0} title="Violations" color="border-blue-500 text-blue-700" />
+        <StatCircle percent={detections} title="Detections" color="border-blue-500 text-blue-700" />
       </div>
 
-      {/* Placeholder for Graphs */}
       <div className="grid grid-cols-1 lg:grid-cols-2 gap-8">
-        {/* Pie Chart Placeholder */}
+        {/* Pie Chart */}
         <div className="bg-white p-6 rounded-xl shadow-lg border border-gray-100">
           <h4 className="text-lg font-semibold mb-4 text-gray-700">Statistic Graph (Compliance Breakdown)</h4>
           <div className="h-64 bg-gray-100 flex items-center justify-center rounded-lg">
-            {/* Simple Pie Chart Representation */}
-            <div className="w-40 h-40 rounded-full bg-conic-gradient" style={{
-              backgroundImage: 'conic-gradient(rgb(30, 64, 175) 0% 50%, rgb(59, 130, 246) 50% 75%, rgb(147, 197, 253) 75% 100%)'
-            }}>
-              <div className="absolute top-1/2 left-1/2 transform -translate-x-1/2 -translate-y-1/2 text-white font-bold text-lg">
-                <span className="text-xs text-gray-800">01 (50%)</span>
-              </div>
-            </div>
+            <div className="w-40 h-40 rounded-full" style={{
+              backgroundImage: stops.length ? `conic-gradient(${stops.join(', ')})` : 'none',
+              backgroundColor: 'rgb(229, 231, 235)'
+            }} />
           </div>
           <div className='flex justify-around mt-4 text-sm'>
-            <span className='text-blue-900'>01</span>
-            <span className='text-blue-600'>02</span>
-            <span className='text-blue-300'>03</span>
+            {top.map(([name, count], i) => (
+              <span key={name} className={PIE_TEXT[i]}>{name} ({Math.round((100 * count) / topTotal)}%)</span>
+            ))}
           </div>
         </div>
 
-        {/* Bar Chart Placeholder */}
+        {/* Bar Chart */}
         <div className="bg-white p-6 rounded-xl shadow-lg border border-gray-100">
-          <h4 className="text-lg font-semibold mb-4 text-gray-700">Statistic Graph (Annual Trend)</h4>
+          <h4 className="text-lg font-semibold mb-4 text-gray-700">Statistic Graph (Violations per Hour)</h4>
           <div className="h-64 bg-gray-100 flex items-end p-2 rounded-lg">
-            {/* Simple Bar Chart Representation */}
             <div className="flex w-full h-full items-end justify-between space-x-1">
-              {[40, 60, 80, 50, 30, 70, 90, 95, 85, 75].map((h, index) => (
-                <div key={index} className="flex flex-col items-center">
+              {hours.map((h) => (
+                <div key={h} className="flex flex-col items-center h-full justify-end">
                   <div
                     className="w-3 md:w-4 bg-indigo-700 rounded-t-sm transition-all duration-500"
-                    style={{ height: `${h}%` }}
+                    style={{ height: `${(100 * perHour[h]) / peak}%` }}
+                    title={`${perHour[h]} violations`}
                   ></div>
-                  <span className='text-xs text-gray-600 mt-1'>{2012 + index}</span>
+                  <span className='text-xs text-gray-600 mt-1'>{new Date(h * 1000).getHours()}h</span>
                 </div>
               ))}
+              {!hours.length && <p className="w-full text-center text-gray-400 self-center">No violations recorded.</p>}
             </div>
           </div>
         </div>
@@ -72,4 +118,4 @@ const DashboardView = () => {
   );
 };
 
-export default DashboardView;
\ No newline at end of file
+export default DashboardView;
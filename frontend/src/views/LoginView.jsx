@@ -39,7 +39,7 @@ const LoginView = ({ onNavigate, onLoginSuccess }) => {
 
       if (response.ok) {
         // Login successful, call parent handler
-        onLoginSuccess({ email, name: data.name || '' });
+        onLoginSuccess({ email, name: data.name || '', token: data.token });
       } else {
         // Show backend error
         setError(data.message || 'Invalid credentials');
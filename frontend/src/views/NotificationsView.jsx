@@ -1,20 +1,55 @@
 // src/views/NotificationsView.jsx
 
-import React from 'react';
+import React, { useEffect, useState } from 'react';
+import { API_BASE } from '../config';
 
 /**
  * Notifications View (Design a4.jpg)
+ * Lists the most recent checks that contained a PPE violation.
  */
-const NotificationsView = () => {
+const NotificationsView = ({ token }) => {
+  const [items, setItems] = useState([]);
+
+  useEffect(() => {
+    const headers = token ? { Authorization: `Bearer ${token}` } : {};
+    fetch(`${API_BASE}/history/recent?violations_only=true&limit=20`, { headers })
+      .then((res) => (res.ok ? res.json() : []))
+      .then(setItems)
+      .catch((err) => console.error('Notifications error:', err));
+  }, [token]);
+
+  if (!items.length) {
+    return (
+      <div className="max-w-4xl mx-auto p-12 text-center bg-white rounded-xl shadow-lg my-12">
+        <h3 className="text-2xl font-semibold text-gray-700 mb-4">Notifications</h3>
+        <p className="text-xl font-bold text-gray-500 p-8">
+          No Notification
+        </p>
+        <p className="text-gray-400">All clear!</p>
+      </div>
+    );
+  }
+
   return (
-    <div className="max-w-4xl mx-auto p-12 text-center bg-white rounded-xl shadow-lg my-12">
-      <h3 className="text-2xl font-semibold text-gray-700 mb-4">Notifications</h3>
-      <p className="text-xl font-bold text-gray-500 p-8">
-        No Notification
-      </p>
-      <p className="text-gray-400">All clear!</p>
+    <div className="max-w-4xl mx-auto p-12 bg-white rounded-xl shadow-lg my-12">
+      <h3 className="text-2xl font-semibold text-gray-700 mb-4 text-center">Notifications</h3>
+      <ul className="divide-y divide-gray-200">
+        {items.map((item) => (
+          <li key={item.id} className="py-3 flex justify-between">
+            <div>
+              <p className="font-semibold text-gray-800">
+                {item.violations} violation{item.violations === 1 ? '' : 's'} in {item.filename || item.source}
+              </p>
+              <p className="text-sm text-gray-500">
+                {Object.entries(item.summary).map(([name, count]) => `${name}: ${count}`).join(', ')}
+              </p>
+            </div>
+            <span className="text-sm text-gray-400">{new Date(item.ts * 1000).toLocaleString()}</span>
+          </li>
+        ))}
+      </ul>
     </div>
   );
 };
 
-export default NotificationsView;
\ No newline at end of file
+export default NotificationsView;
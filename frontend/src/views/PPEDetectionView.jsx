@@ -1,9 +1,9 @@
-import React, { useState, useRef } from "react";
+import React, { useState, useRef, useEffect } from "react";
 import axios from "axios";
 import Webcam from "react-webcam";
-import { API_BASE } from "../config";
+import { API_BASE, WS_BASE } from "../config";
 
-const PPEDetectionView = () => {
+const PPEDetectionView = ({ token }) => {
   const [file, setFile] = useState(null);
   const [detections, setDetections] = useState([]);
   const [originalMedia, setOriginalMedia] = useState("");
@@ -14,6 +14,9 @@ const PPEDetectionView = () => {
   const [useWebcam, setUseWebcam] = useState(false);
   const webcamRef = useRef(null);
   const [summary, setSummary] = useState({});
+  const [live, setLive] = useState(false);
+  const [liveStats, setLiveStats] = useState(null);
+  const wsRef = useRef(null);
 
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
@@ -37,6 +40,103 @@ const PPEDetectionView = () => {
       });
   };
 
+  // --- Live mode: stream webcam frames over a WebSocket ---
+  // The next frame is only sent once the previous result is back,
+  // and the server drops stale frames if it still falls behind.
+  const sendLiveFrame = () => {
+    const ws = wsRef.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN || !webcamRef.current) return;
+    const imageSrc = webcamRef.current.getScreenshot();
+    if (!imageSrc) return setTimeout(sendLiveFrame, 100);
+    fetch(imageSrc)
+      .then((res) => res.blob())
+      .then((blob) => ws.send(blob));
+  };
+
+  const stopLive = () => {
+    if (wsRef.current) wsRef.current.close();
+    wsRef.current = null;
+    setLive(false);
+  };
+
+  const startLive = () => {
+    // WebSockets cannot carry an Authorization header, the token goes in the URL
+    const query = token ? `?token=${encodeURIComponent(token)}` : "";
+    const ws = new WebSocket(`${WS_BASE}/ws/detect${query}`);
+    ws.onopen = sendLiveFrame;
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.detections) {
+        setDetections(data.detections);
+        setSummary(data.summary || {});
+      }
+      // A frame the server had to drop comes back as {received, dropped} only
+      setLiveStats((prev) => ({ latency: data.latency_ms ?? prev?.latency, dropped: data.dropped }));
+      sendLiveFrame();
+    };
+    ws.onerror = () => alert("Live detection connection failed.");
+    ws.onclose = () => setLive(false);
+    wsRef.current = ws;
+    setLive(true);
+  };
+
+  useEffect(() => stopLive, []);
+
+  // Poll GET /api/jobs/{id} until the job finishes; returns its result
+  const waitForJob = async (jobId) => {
+    const headers = token ? { Authorization: `Bearer ${token}` } : {};
+    for (;;) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const { data: job } = await axios.get(`${API_BASE}/jobs/${jobId}`, { headers });
+      if (job.status === "done") return job.result;
+      if (job.status === "failed") throw new Error(job.error || "Job failed");
+      if (job.progress?.percent != null) setProgress(Math.round(job.progress.percent));
+    }
+  };
+
+  // Large videos go up in checksummed chunks; a failed chunk is retried
+  // from the offset the server reports, so a flaky link never restarts at zero
+  const CHUNKED_UPLOAD_BYTES = 8 * 1024 * 1024;
+
+  const sha256Hex = async (blob) => {
+    if (!window.crypto?.subtle) return null; // only on https / localhost
+    const hash = await window.crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+    return Array.from(new Uint8Array(hash)).map((b) => b.toString(16).padStart(2, "0")).join("");
+  };
+
+  const uploadInChunks = async (headers) => {
+    const { data: session } = await axios.post(
+      `${API_BASE}/uploads`,
+      { filename: file.name, size: file.size, content_type: file.type },
+      { headers }
+    );
+    let offset = session.offset;
+    let failures = 0;
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + session.chunk_size);
+      try {
+        const checksum = await sha256Hex(chunk);
+        const res = await axios.put(`${API_BASE}/uploads/${session.upload_id}?offset=${offset}`, chunk, {
+          headers: {
+            ...headers,
+            "Content-Type": "application/octet-stream",
+            ...(checksum ? { "X-Chunk-SHA256": checksum } : {}),
+          },
+        });
+        offset = res.data.offset;
+        failures = 0;
+        setProgress(Math.round((offset * 100) / file.size));
+      } catch (err) {
+        if (err.response?.status === 401 || ++failures > 5) throw err;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+        const { data: status } = await axios.get(`${API_BASE}/uploads/${session.upload_id}`, { headers });
+        offset = status.offset;
+      }
+    }
+    const res = await axios.post(`${API_BASE}/uploads/${session.upload_id}/finalize`, {}, { headers });
+    return res.data.job_id;
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     if (!file) return alert("Please upload an image or video first!");
@@ -44,35 +144,57 @@ const PPEDetectionView = () => {
     const formData = new FormData();
     formData.append("file", file);
 
+    const headers = {
+      "Content-Type": "multipart/form-data",
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    };
+
     try {
       setLoading(true);
-      setProgress(30); // Initial progress state
-
-    const res = await axios.post(`${API_BASE}/predict/`, formData, {
-
-  headers: { "Content-Type": "multipart/form-data" },
-  onUploadProgress: (progressEvent) => {
-    const percent = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-    setProgress(percent);
-  },
-});
-
+      setProgress(0);
 
-      setProgress(90); // Close to completion
+      let data;
+      if (isVideo) {
+        // Videos run as a background job: upload, then poll for real progress
+        let jobId;
+        if (file.size > CHUNKED_UPLOAD_BYTES) {
+          const authHeaders = token ? { Authorization: `Bearer ${token}` } : {};
+          jobId = await uploadInChunks(authHeaders);
+        } else {
+          const res = await axios.post(`${API_BASE}/jobs`, formData, { headers });
+          jobId = res.data.job_id;
+        }
+        setProgress(0);
+        data = await waitForJob(jobId);
+      } else {
+        const res = await axios.post(`${API_BASE}/predict/`, formData, {
+          headers,
+          onUploadProgress: (progressEvent) => {
+            const percent = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+            setProgress(percent);
+          },
+        });
+        data = res.data;
+      }
 
-      const data = res.data;
       setDetections(data.detections || []);
       setSummary(data.summary || {});
      
 
 const BASE = "http://teimsafety.com";
 
+// In-memory mode returns the annotated image inline (data: URL) and
+// may not keep the original on the server
+const mediaUrl = (path) => (path.startsWith("data:") ? path : `${BASE}${path}`);
+
 if (data.original_image) {
-  setOriginalMedia(`${BASE}${data.original_image}`);
+  setOriginalMedia(mediaUrl(data.original_image));
+} else {
+  setOriginalMedia(URL.createObjectURL(file));
 }
 
 if (data.annotated_image) {
-  setAnnotatedMedia(`${BASE}${data.annotated_image}`);
+  setAnnotatedMedia(mediaUrl(data.annotated_image));
 }
 
 
@@ -80,7 +202,11 @@ if (data.annotated_image) {
       setProgress(100);
     } catch (err) {
       console.error("Prediction error:", err);
-      alert("Something went wrong while detecting PPE.");
+      if (err.response?.status === 401) {
+        alert("Your session has expired. Please log in again.");
+      } else {
+        alert("Something went wrong while detecting PPE.");
+      }
     } finally {
       setLoading(false);
       setTimeout(() => setProgress(0), 800);
@@ -179,7 +305,20 @@ if (data.annotated_image) {
               >
                 {loading ? "Processing..." : "Detect from Capture"}
               </button>
+              <button
+                onClick={live ? stopLive : startLive}
+                className={`px-6 py-2 rounded font-semibold text-white transition-all duration-300 ${
+                  live ? "bg-red-600 hover:bg-red-700" : "bg-indigo-600 hover:bg-indigo-700"
+                }`}
+              >
+                {live ? "Stop Live" : "Start Live"}
+              </button>
             </div>
+            {live && liveStats && (
+              <p className="text-sm text-gray-600">
+                Live: {liveStats.latency} ms per frame, {liveStats.dropped} frames dropped
+              </p>
+            )}
           </div>
         )}
       </div>